@@ -1,63 +1,83 @@
 # app.py
 import streamlit as st
-from streamlit_player import st_player
-import streamlit.components.v1 as components
 import os
-import face_recognition
-from gtts import gTTS
-import glob
-import bcrypt
-from sqlalchemy import create_engine, Column, Integer, String, text, ForeignKey, LargeBinary
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from auth import signup_user, login_user, login_user_with_face, get_user_id_by_email
-from book_appointment import book_appointment
-import google.generativeai as genai
-from api import GEMINI_API_KEY
+import time
+import uuid
+from datetime import date
+from concurrent.futures import wait
+from database import init_db, engine
+import metrics
+from auth import signup_user, login_user, login_user_with_face, identify_user_by_face, get_user_profile
+from book_appointment import reserve_appointment, get_user_appointments, InvalidBooking
+from availability import get_specialists, get_slot_grid, free_slots, slot_has_passed
+import conversation_store
+import response_cache
+from auth_pool import TooManyAttempts, AuthBusy, client_ip
+from face_service import get_face_service, FaceServiceBusy, FaceServiceTimeout, FaceQualityError
 
 
 # --- Streamlit App Config ---
 st.set_page_config(page_title="AI Receptionist", layout="centered")
 
-# 1) Initialize database
-DATABASE_URL = "sqlite:///database.db"
-Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-
-# 2) Define a User model
-class User(Base):
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    face_encoding = Column(LargeBinary, nullable=True)
-
-    # If you want a backref relationship:
-    appointments = relationship("Appointment", back_populates="user")
-
-class Appointment(Base):
-    __tablename__ = "appointments"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    specialist = Column(String, nullable=False)
-    date = Column(String, nullable=False)
-    time_slot = Column(String, nullable=False)
-
-    # Relationship back to User
-    user = relationship("User", back_populates="appointments")
-
-# 3) Create tables if they don't exist
-Base.metadata.create_all(engine)
-session = SessionLocal()
+# --- Process-wide resources ---
+# Streamlit re-runs this script on every interaction; these are created once
+# per process and heavy libraries are imported only by the pages that use them.
+@st.cache_resource(show_spinner=False)
+def load_database():
+    """Check the schema once and share the pooled engine."""
+    init_db()
+    return engine
+
+@st.cache_resource(show_spinner="Starting face recognition...")
+def load_face_service():
+    return get_face_service()
+
+@st.cache_resource(show_spinner=False)
+def load_chat_manager():
+    from chat_sessions import get_chat_manager
+    return get_chat_manager()
+
+@st.cache_resource(show_spinner=False)
+def load_speech():
+    """Import the TTS pipeline and pre-synthesize the stock phrases."""
+    import speech
+    speech.warm_stock_phrases()
+    return speech
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_endpoint():
+    """Serve Prometheus metrics on METRICS_PORT and write METRICS_FILE, if configured."""
+    metrics.start_http_server()
+    metrics.start_file_writer()
+    return True
+
+load_database()
+start_metrics_endpoint()
+
+# How long one script run blocks on pending speech before rerunning, and how
+# long a reply's speech is polled for at all (later it attaches on the next rerun)
+AUDIO_POLL_SECONDS = float(os.getenv("AUDIO_POLL_SECONDS", "0.5"))
+AUDIO_WAIT_SECONDS = float(os.getenv("AUDIO_WAIT_SECONDS", "30"))
+
+def get_client_ip():
+    """Best-effort client IP for login throttling, as seen by the outermost trusted proxy."""
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        headers = _get_websocket_headers() or {}
+    except ImportError:
+        return None
+    return client_ip(headers.get("X-Forwarded-For"), headers.get("X-Real-Ip"))
 
 # --- Session State Initialization ---
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "user_email" not in st.session_state:
     st.session_state.user_email = ""
-if "conversation" not in st.session_state or not isinstance(st.session_state.conversation, list):
+if st.session_state.get("user_id") is None:
+    # Resolve once per session (login normally sets it straight from the cache)
+    profile = get_user_profile(st.session_state.get("user_email")) if st.session_state.get("logged_in") else None
+    st.session_state.user_id = profile.id if profile else None
+if "conversation" not in st.session_state:
     st.session_state.conversation = []
 if "appointments" not in st.session_state:
     st.session_state.appointments = []
@@ -67,13 +87,6 @@ if "appointments" not in st.session_state:
 if "chat_input" not in st.session_state:
     st.session_state.chat_input = ""
 
-def clear_audio_files():
-    for file in glob.glob("*.mp3"):
-        try:
-            os.remove(file)
-        except Exception as e:
-            st.error(f"Error removing file {file}: {e}")
-
 
 # --- Main Title ---
 st.title("AI Receptionist")
@@ -82,6 +95,27 @@ st.title("AI Receptionist")
 page_options = ["Sign Up", "Login", "Chat", "Book Appointment"]
 choice = st.sidebar.selectbox("Navigate", page_options)
 
+# --- Admin-only performance panel ---
+ADMIN_EMAILS = {e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+if metrics.METRICS_ENABLED and st.session_state.get("user_email") in ADMIN_EMAILS:
+    with st.sidebar.expander("Performance (rolling)"):
+        stage_summary = metrics.summary()
+        if stage_summary:
+            st.dataframe(
+                {
+                    "stage": list(stage_summary.keys()),
+                    "count": [v["count"] for v in stage_summary.values()],
+                    "p50 ms": [round(v["p50_ms"], 1) for v in stage_summary.values()],
+                    "p95 ms": [round(v["p95_ms"], 1) for v in stage_summary.values()],
+                    "p99 ms": [round(v["p99_ms"], 1) for v in stage_summary.values()],
+                },
+                use_container_width=True,
+            )
+        else:
+            st.caption("No samples yet.")
+        for name, value in sorted(metrics.counters().items()):
+            st.caption(f"{name}: {value}")
+
 # --- SIGN UP PAGE ---
 if choice == "Sign Up":
     st.subheader("Create a New Account (with optional face)")
@@ -93,27 +127,39 @@ if choice == "Sign Up":
     face_image = st.camera_input("Capture your face (optional)")
 
     if st.button("Sign Up"):
-        if not email or not password:
-            st.warning("Please enter email & password.")
-        else:
-            # 1. If face_image is provided, encode it
-            face_encoding_bytes = None
-            if face_image is not None:
-                # Convert to numpy array for face_recognition
-                img = face_recognition.load_image_file(face_image)
-                encodings = face_recognition.face_encodings(img)
-                if len(encodings) > 0:
-                    face_encoding = encodings[0]
-                    face_encoding_bytes = face_encoding.tobytes()
-                else:
-                    st.warning("No face detected. Your account will be created without face data.")
-
-            # 2. Call signup_user from auth
-            success = signup_user(email, password, face_encoding_bytes)
-            if success:
-                st.success("User created successfully! Please log in.")
+        with metrics.request("signup"):
+            if not email or not password:
+                st.warning("Please enter email & password.")
             else:
-                st.error("User with that email already exists. Try a different one.")
+                # 1. If face_image is provided, encode it
+                face_encoding_bytes = None
+                if face_image is not None:
+                    # Encode in the face worker pool instead of on the script thread
+                    try:
+                        encodings = load_face_service().encode(face_image.getvalue())
+                    except FaceQualityError as e:
+                        # Bad frame: ask for a retake before spending time on encoding
+                        st.warning(str(e))
+                        st.stop()
+                    except (FaceServiceBusy, FaceServiceTimeout) as e:
+                        st.error(str(e))
+                        st.stop()
+                    if len(encodings) > 0:
+                        face_encoding = encodings[0]
+                        face_encoding_bytes = face_encoding.tobytes()
+                    else:
+                        st.warning("No face detected. Your account will be created without face data.")
+
+                # 2. Call signup_user from auth
+                try:
+                    success = signup_user(email, password, face_encoding_bytes)
+                except AuthBusy as e:
+                    st.error(str(e))
+                    st.stop()
+                if success:
+                    st.success("User created successfully! Please log in.")
+                else:
+                    st.error("User with that email already exists. Try a different one.")
 
 # --- LOGIN PAGE ---
 elif choice == "Login":
@@ -126,38 +172,57 @@ elif choice == "Login":
         email = st.text_input("Email")
         password = st.text_input("Password", type="password")
         if st.button("Login"):
-            if login_user(email, password):
-                st.session_state.logged_in = True
-                st.session_state.user_email = email
-                clear_audio_files()  # Clear old audio files
-                st.success("Login successful!")
-            else:
-                st.error("Invalid email or password.")
+            with metrics.request("login"):
+                try:
+                    logged_in = login_user(email, password, client_ip=get_client_ip())
+                except (TooManyAttempts, AuthBusy) as e:
+                    st.error(str(e))
+                    st.stop()
+                if logged_in:
+                    st.session_state.logged_in = True
+                    st.session_state.user_email = email
+                    st.session_state.user_id = get_user_profile(email).id  # Cached by login_user
+                    st.success("Login successful!")
+                else:
+                    st.error("Invalid email or password.")
 
     else:  # Face login
-        email = st.text_input("Email (for face matching)")
-        # Alternatively, do a "who is this face?" by matching DB encodings, but we keep it simpler here
+        email = st.text_input("Email (optional, leave empty to identify by face)")
         face_image = st.camera_input("Capture your face")
 
         if st.button("Login with Face"):
-            if email and face_image is not None:
-                img = face_recognition.load_image_file(face_image)
-                encodings = face_recognition.face_encodings(img)
-                if len(encodings) > 0:
-                    new_encoding = encodings[0]
-                    # Compare with DB
-                    if login_user_with_face(email, new_encoding):
-                        st.session_state.logged_in = True
-                        st.session_state.user_email = email
-                        clear_audio_files()  # Clear old audio files
-                        st.success("Face login successful!")
-                        
+            with metrics.request("face_login"):
+                if face_image is not None:
+                    try:
+                        encodings = load_face_service().encode(face_image.getvalue())
+                    except FaceQualityError as e:
+                        # Bad frame: ask for a retake before spending time on encoding
+                        st.warning(str(e))
+                        st.stop()
+                    except (FaceServiceBusy, FaceServiceTimeout) as e:
+                        st.error(str(e))
+                        st.stop()
+                    if len(encodings) > 0:
+                        new_encoding = encodings[0]
+                        if email:
+                            # 1:1 check against the given account
+                            matched_email = email if login_user_with_face(email, new_encoding) else None
+                        else:
+                            # 1:N "who is this face?" against every enrolled user
+                            match = identify_user_by_face(new_encoding)
+                            matched_email = match[0] if match else None
+
+                        if matched_email:
+                            st.session_state.logged_in = True
+                            st.session_state.user_email = matched_email
+                            st.session_state.user_id = get_user_profile(matched_email).id
+                            st.success(f"Face login successful! Welcome, {matched_email}.")
+                        else:
+                            st.error("Face login failed: no match or user doesn't have face data.")
                     else:
-                        st.error("Face login failed: no match or user doesn't have face data.")
+                        st.error("No face detected in the captured image.")
                 else:
-                    st.error("No face detected in the captured image.")
-            else:
-                st.warning("Please provide email and capture your face.")
+                    st.warning("Please capture your face.")
 
 # --- CHAT PAGE ---
 elif choice == "Chat":
@@ -165,146 +230,206 @@ elif choice == "Chat":
         st.warning("You must log in before you can chat.")
     else:
         #clear_audio_files()  # Clear old audio files
+        speech = load_speech()
         st.subheader(f"Welcome, {st.session_state.user_email}!")
         st.write("Feel free to chat with AI Receptionist. Type 'exit' to clear conversation.")
 
-        # Display conversation
+        # Load the persisted conversation once per login; only a bounded
+        # window of it is kept in memory
+        if st.session_state.get("conversation_user") != st.session_state.user_id:
+            st.session_state.conversation = conversation_store.recent_messages(st.session_state.user_id, conversation_store.CHAT_WINDOW)
+            st.session_state.conversation_user = st.session_state.user_id
+            st.session_state.chat_visible = conversation_store.CHAT_PAGE_SIZE
+        conversation = st.session_state.conversation
+
+        # Display conversation: the last page only, older pages on request
         st.write("---")
-        for idx, msg in enumerate(st.session_state.conversation):
-            if isinstance(msg, dict) and "type" in msg and "text" in msg:
-                if msg["type"] == "user":
-                    st.markdown(f"**User:** {msg['text']}")
-                elif msg["type"] == "ai":
-                    st.markdown(f"**AI:** {msg['text']}")
-                    if "audio" in msg:
-                        st.audio(msg["audio"], format="audio/mp3")
-            # else:
-            #     st.error(f"Invalid message format in conversation at index {idx}: {msg}")
+        if not conversation:
+            st.markdown(f"**AI:** {speech.GREETING}")
+            greeting_audio = speech.cached_audio(speech.GREETING)
+            if greeting_audio:
+                st.audio(greeting_audio, format="audio/mp3")
+
+        visible = conversation[-st.session_state.chat_visible:]
+        if st.session_state.chat_visible > len(conversation) and conversation:
+            # Pages beyond the in-memory window come straight from SQLite
+            visible = conversation_store.recent_messages(
+                st.session_state.user_id, st.session_state.chat_visible - len(conversation), before_id=conversation[0]["id"]
+            ) + visible
+        oldest_id = visible[0]["id"] if visible else None
+        if oldest_id is not None and conversation_store.recent_messages(st.session_state.user_id, 1, before_id=oldest_id):
+            if st.button("Load earlier messages"):
+                st.session_state.chat_visible += conversation_store.CHAT_PAGE_SIZE
+                st.experimental_rerun()
+
+        audio_pending = False
+        for msg in visible:
+            if msg["type"] == "user":
+                st.markdown(f"**User:** {msg['text']}")
+            elif msg["type"] == "ai":
+                st.markdown(f"**AI:** {msg['text']}")
+                if speech.resolve_audio(msg):
+                    st.caption("Audio pending...")
+                    audio_pending = True
+                elif msg.get("audio"):
+                    st.audio(msg["audio"], format="audio/mp3")
         st.write("---")
 
 
         # Create the text input widget with key="chat_input"
         user_input = st.text_input("Enter your message:", key="chat_input")
+        stream_replies = st.checkbox("Stream replies", value=True)
 
         if st.button("Send"):
-            if user_input.strip() == "":
-                st.warning("Please enter a message.")
-            else:
-                # If user types 'exit', clear conversation
-                if user_input.lower().strip() == "exit":
-                    st.session_state.conversation = []
-                    st.info("Conversation cleared.")
+            with metrics.request("chat_send"):
+                if user_input.strip() == "":
+                    st.warning("Please enter a message.")
                 else:
-                  st.session_state.conversation.append({"type": "user", "text": user_input})
-                  #Append user message to conversation
-                  if os.path.exists("ai_response.mp3"):
-                      os.remove("ai_response.mp3")
-
-                  st.session_state.conversation.append(f"User: {user_input}")
-
-                  # Configure the API key from your environment variables
-                  genai.configure(api_key=GEMINI_API_KEY)
-
-                  # Create the model with custom generation settings
-                  generation_config = {
-                  "temperature": 1,
-                  "top_p": 0.95,
-                  "top_k": 40,
-                  "max_output_tokens": 8192,
-                  "response_mime_type": "text/plain",
-                  }
-
-                  # Instantiate a GenerativeModel
-                  model = genai.GenerativeModel(
-                  model_name="gemini-2.0-flash-exp",
-                  generation_config=generation_config,
-                  )
-
-                  # Start the chat session with a role-play scenario
-                  chat_session = model.start_chat(
-                  history=[
-                  {
-                    "role": "user",
-                    "parts": [
-                        "You are an AI Hospital Receptionist. Your job is to analyse the patient's "
-                        "symptoms and redirect to a specialist doctor. You can ask questions to the patient to "
-                        "gather more information. Guide them on the next steps to be taken and tell which doctor to meet. "
-                        "Suggest which tests are to be done and the specialist to be consulted."
-                        "Remember to be empathetic and supportive; and be very friendly. Finally tell the user to book the "
-                        "appointment in our website under the 'Book Appointment' section."
-                    ],
-                  },
-                  {
-                    "role": "model",
-                    "parts": [
-                        "Okay, I understand. I'm ready to help. Please, tell me what's been going on. "
-                        "What symptoms are you experiencing? The more details you can give me, the better "
-                        "I can understand what might be happening. Don't worry, I'm here to listen and "
-                        "help you figure this out.\n"
-                    ],
-                  },
-                  ]
-                  )
-
-                  # Send the user's new message to the model
-                  response = chat_session.send_message(user_input)
-
-                  # Append AI's response to conversation
-                  st.session_state.conversation.append(f"AI: {response.text}")
-                  ai_reply = response.text
-                  ai_reply_clean = ai_reply.replace("*", "")
-                  # Convert AI response to speech
-                  audio_file_path = f"response_{len(st.session_state.conversation)}.mp3"
-                  tts = gTTS(ai_reply)
-                  tts.save(audio_file_path)
-
-                  st.session_state.conversation.append({"type": "ai", "text": ai_reply, "audio": audio_file_path})
-
-
-
-                #   try:
-                #       ai_reply = response.text
-                #       ai_reply_clean = ai_reply.replace("*", "")
-                #       tts = gTTS(ai_reply_clean)
-                #       audio_file_path = "ai_response.mp3"
-                #       tts.save(audio_file_path)
-                #       if os.path.exists(audio_file_path):
-                #         audio_url = f"data:audio/mp3;base64,{open(audio_file_path, 'rb').read().hex()}"
-                #         autoplay_html = f"""
-                #             <audio autoplay>
-                #                 <source src="{audio_url}" type="audio/mp3">
-                #             </audio>
-                #         """
-                #         components.html(autoplay_html)
-                #   except Exception as e:
-                #       st.error(f"Error generating audio: {e}")
-
-                      # Check if the file exists
-                #       if os.path.exists(audio_file_path):
-                #           # Stream the audio to the browser
-                #           #st.audio(audio_file_path, format="audio/mp3")
-                #           st_player(audio_file_path, playing=True, loop=False)
-                #       else:
-                #           st.error("Audio file not found.")
-                #   except Exception as e:
-                #       st.error(f"Error generating audio: {e}")
-
-                #   ai_reply = response.text
-                #   ai_reply_clean = ai_reply.replace("*", "")
-                #   tts = gTTS(ai_reply_clean)
-                #   tts.save("ai_response.mp3")
-                #   pygame.mixer.init()
-                #   # Load and play the audio file
-                #   pygame.mixer.music.load("ai_response.mp3")
-                #   pygame.mixer.music.play()
-                #   # Wait for playback to finish
-                #   while pygame.mixer.music.get_busy():
-                #       continue
-                #   pygame.mixer.quit()
-                #   st.audio("ai_response.mp3", format="audio/mp3")
-
-                  # Reset text input, then rerun so the widget re-initializes
-                  #st.session_state.chat_input = "---"
+                    # If user types 'exit', clear conversation
+                    if user_input.lower().strip() == "exit":
+                        conversation_store.clear_messages(st.session_state.user_id)
+                        st.session_state.conversation = []
+                        load_chat_manager().reset(st.session_state.user_email)
+                        st.info("Conversation cleared.")
+                    else:
+                      # First-turn messages ("I have a headache") are often repeated
+                      # verbatim, so they may be answered from the response cache
+                      first_turn = not conversation
+                      cached_reply = response_cache.get(user_input) if first_turn else None
+
+                      user_msg = conversation_store.add_message(st.session_state.user_id, "user", user_input)
+                      conversation.append(user_msg)
+
+                      def seed_turns():
+                          # Only used if the live chat session was evicted or never existed
+                          earlier = conversation_store.recent_messages(st.session_state.user_id, conversation_store.CHAT_WINDOW, before_id=user_msg["id"])
+                          return [(m["type"], m["text"]) for m in earlier]
+
+                      def remember_reply(ai_reply):
+                          if cached_reply is not None:
+                              # Answered from cache: the live chat session still needs the turn
+                              load_chat_manager().record(st.session_state.user_email, user_input, ai_reply, seed_turns)
+                          elif first_turn:
+                              response_cache.put(user_input, ai_reply)
+
+                      if stream_replies:
+                          # Render tokens as they arrive and synthesize each sentence
+                          # while the model is still generating the next ones
+                          st.markdown(f"**User:** {user_input}")
+                          reply_placeholder = st.empty()
+                          ai_reply = ""
+                          audio_futures = []
+                          audio_parts = []
+
+                          def play_ready_audio():
+                              # Play sentence audio in order, as soon as each one is ready
+                              while len(audio_parts) < len(audio_futures):
+                                  future = audio_futures[len(audio_parts)]
+                                  if not future.done():
+                                      break
+                                  try:
+                                      audio_parts.append(future.result())
+                                      st.audio(audio_parts[-1], format="audio/mp3")
+                                  except Exception:
+                                      audio_parts.append(b"")  # Text-only for this sentence
+
+                          if cached_reply is not None:
+                              reply_stream = iter([cached_reply])  # Sentence audio also comes from the audio cache
+                          else:
+                              reply_stream = load_chat_manager().stream(st.session_state.user_email, user_input, seed_turns)
+                          for kind, text, audio_future in speech.stream_speech(reply_stream):
+                              if kind == "text":
+                                  ai_reply += text
+                                  reply_placeholder.markdown(f"**AI:** {ai_reply}")
+                              else:
+                                  audio_futures.append(audio_future)
+                              play_ready_audio()
+                          # Save the reply before waiting on any audio, so slow TTS cannot lose it
+                          remember_reply(ai_reply)
+                          ai_msg = conversation_store.add_message(st.session_state.user_id, "ai", ai_reply)
+                          conversation.append(ai_msg)
+                          conversation_store.trim_window(conversation)
+
+                          wait(audio_futures, timeout=AUDIO_POLL_SECONDS)
+                          play_ready_audio()
+                          if len(audio_parts) == len(audio_futures):
+                              ai_msg["audio"] = b"".join(audio_parts)
+                          else:
+                              # Still synthesizing: the whole reply's audio is attached
+                              # to the message on a later rerun, once every sentence is done
+                              speech.attach_audio(ai_msg, future=speech.join_audio(audio_futures))
+                          # No rerun here, so the sentence players above keep playing
+                          st.stop()
+
+                      # Send only the new message; the user's chat session keeps earlier turns
+                      if cached_reply is not None:
+                          ai_reply = cached_reply
+                      else:
+                          ai_reply = load_chat_manager().send(st.session_state.user_email, user_input, seed_turns)
+                      remember_reply(ai_reply)
+
+                      # Append AI's response to conversation. Show the text right away;
+                      # speech is synthesized in the background and attached to this
+                      # message when ready (text-only if TTS fails)
+                      ai_msg = conversation_store.add_message(st.session_state.user_id, "ai", ai_reply)
+                      conversation.append(speech.attach_audio(ai_msg))
+                      conversation_store.trim_window(conversation)
+
+
+
+                    #   try:
+                    #       ai_reply = response.text
+                    #       ai_reply_clean = ai_reply.replace("*", "")
+                    #       tts = gTTS(ai_reply_clean)
+                    #       audio_file_path = "ai_response.mp3"
+                    #       tts.save(audio_file_path)
+                    #       if os.path.exists(audio_file_path):
+                    #         audio_url = f"data:audio/mp3;base64,{open(audio_file_path, 'rb').read().hex()}"
+                    #         autoplay_html = f"""
+                    #             <audio autoplay>
+                    #                 <source src="{audio_url}" type="audio/mp3">
+                    #             </audio>
+                    #         """
+                    #         components.html(autoplay_html)
+                    #   except Exception as e:
+                    #       st.error(f"Error generating audio: {e}")
+
+                          # Check if the file exists
+                    #       if os.path.exists(audio_file_path):
+                    #           # Stream the audio to the browser
+                    #           #st.audio(audio_file_path, format="audio/mp3")
+                    #           st_player(audio_file_path, playing=True, loop=False)
+                    #       else:
+                    #           st.error("Audio file not found.")
+                    #   except Exception as e:
+                    #       st.error(f"Error generating audio: {e}")
+
+                    #   ai_reply = response.text
+                    #   ai_reply_clean = ai_reply.replace("*", "")
+                    #   tts = gTTS(ai_reply_clean)
+                    #   tts.save("ai_response.mp3")
+                    #   pygame.mixer.init()
+                    #   # Load and play the audio file
+                    #   pygame.mixer.music.load("ai_response.mp3")
+                    #   pygame.mixer.music.play()
+                    #   # Wait for playback to finish
+                    #   while pygame.mixer.music.get_busy():
+                    #       continue
+                    #   pygame.mixer.quit()
+                    #   st.audio("ai_response.mp3", format="audio/mp3")
+
+                      # Reset text input, then rerun so the widget re-initializes
+                      #st.session_state.chat_input = "---"
+                    st.experimental_rerun()
+
+        # Speech for a reply is still being synthesized: the page is already
+        # rendered, so wait a moment and rerun to attach whatever finished
+        if audio_pending:
+            now = time.monotonic()
+            pending = [m["audio_future"] for m in conversation
+                       if "audio_future" in m and now - m.get("audio_started", now) < AUDIO_WAIT_SECONDS]
+            if pending:
+                wait(pending, timeout=AUDIO_POLL_SECONDS)
                 st.experimental_rerun()
         
 
@@ -317,41 +442,85 @@ elif choice == "Book Appointment":
         st.write("---")
         st.write("**Schedule a new appointment**")
 
-        # Example list of specialists (in real app, might query from DB)
-        specialists = ["Cardiologist", "Neurologist", "Dermatologist", "Orthopedist", "Pediatrician"]
+        # Specialists and slot templates come from the DB; only open slots are offered
+        specialists = get_specialists()
+        specialist = st.selectbox("Select a Specialist", specialists)
+        days_ahead = st.slider("Days to show", min_value=7, max_value=28, value=14, step=7)
+        availability = free_slots(specialist, date.today(), days_ahead)
+
+        # Calendar view: one row per day, one column per slot
+        with st.expander("Availability calendar", expanded=False):
+            grid = get_slot_grid(specialist)
+            calendar = {"date": list(availability.keys())}
+            for slot in grid:
+                calendar[slot] = [
+                    "open" if slot in open_slots else "past" if slot_has_passed(day, slot) else "booked"
+                    for day, open_slots in availability.items()
+                ]
+            st.dataframe(calendar, use_container_width=True)
+
+        open_days = [day for day, open_slots in availability.items() if open_slots]
+        if open_days:
+            appt_date = st.selectbox("Select Date", open_days)
+        else:
+            st.info(f"No open slots with {specialist} in the next {days_ahead} days.")
+            appt_date = None
+
+        # Idempotency key per session and requested slot: a double-submit or
+        # retry of the same form gets the original booking back
+        if "booking_nonce" not in st.session_state:
+            st.session_state.booking_nonce = uuid.uuid4().hex
 
         with st.form("appointment_form"):
-            specialist = st.selectbox("Select a Specialist", specialists)
-            date = st.date_input("Select Date")
-            time_slot = st.selectbox("Select Time Slot", ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "04:00 PM"])
+            time_slot = st.selectbox("Select Time Slot", availability[appt_date] if appt_date else [])
 
             confirm_btn = st.form_submit_button("Book Appointment")
 
-        if confirm_btn:
-            # In production, you'd also check if the slot is available, handle conflicts, etc.
-            appointment_info = {
-                "specialist": specialist,
-                "date": date.strftime("%Y-%m-%d"),
-                "time": time_slot
-            }
-            st.session_state.appointments.append(appointment_info)
-            booked_appt = book_appointment(get_user_id_by_email(st.session_state.user_email), specialist, date.strftime("%Y-%m-%d"), time_slot)
-            st.success(f"Appointment booked with {specialist} on {appointment_info['date']} at {time_slot}! \n Booking ID: {booked_appt.id}")  
-            user_appointments = session.query(Appointment).filter_by(user_id=get_user_id_by_email(st.session_state.user_email)).all()
-
-            # 2) Display them right here in the Login page
-            if user_appointments:
-                st.write("## Your Current Appointments:")
-                for i, appt in enumerate(user_appointments, start=1):
-                    st.write(
-                        f"{i}. [ID: {appt.id}] {appt.specialist} on {appt.date} at {appt.time_slot}"
-                    )
-            else:
-                st.info("No appointments found for this user.")  
+        if confirm_btn and appt_date and time_slot:
+            with metrics.request("book"):
+                appointment_info = {
+                    "specialist": specialist,
+                    "date": appt_date,
+                    "time": time_slot
+                }
+                booking_key = f"{st.session_state.booking_nonce}:{specialist}:{appt_date}:{time_slot}"
+                try:
+                    result = reserve_appointment(st.session_state.user_id, specialist, appt_date, time_slot,
+                                                 idempotency_key=booking_key)
+                except InvalidBooking as e:
+                    result = None
+                    st.error(str(e))
+                if result is None:
+                    pass
+                elif result.status == "taken":
+                    st.error(f"Sorry, {specialist} on {appt_date} at {time_slot} was just booked by someone else.")
+                    if result.alternatives:
+                        st.write("Nearest open slots:")
+                        for alt_date, alt_slot in result.alternatives:
+                            st.write(f"- {alt_date} at {alt_slot}")
+                else:
+                    booked_appt = result.appointment
+                    if result.status == "booked":
+                        st.session_state.appointments.append(appointment_info)
+                    st.success(f"Appointment booked with {booked_appt.specialist} on {booked_appt.date} at {booked_appt.time_slot}! \n Booking ID: {booked_appt.id}")  
+                user_appointments = get_user_appointments(st.session_state.user_id)
+
+                # 2) Display them right here in the Login page
+                if user_appointments:
+                    st.write("## Your Current Appointments:")
+                    for i, appt in enumerate(user_appointments, start=1):
+                        st.write(
+                            f"{i}. [ID: {appt.id}] {appt.specialist} on {appt.date} at {appt.time_slot}"
+                        )
+                else:
+                    st.info("No appointments found for this user.")  
 
         # Option to log out
         if st.button("Log Out"):
+            load_chat_manager().reset(st.session_state.user_email)
             st.session_state.logged_in = False
             st.session_state.user_email = ""
+            st.session_state.user_id = None
             st.session_state.conversation = []
+            st.session_state.conversation_user = None
             st.experimental_rerun()
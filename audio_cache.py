@@ -0,0 +1,150 @@
+# audio_cache.py
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# -----------------------------------------------------------------------------
+# 1. Settings
+# -----------------------------------------------------------------------------
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(".cache", "tts"))
+AUDIO_CACHE_MEMORY_BYTES = int(os.getenv("AUDIO_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+AUDIO_CACHE_DISK_BYTES = int(os.getenv("AUDIO_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+# -----------------------------------------------------------------------------
+# 2. Content-addressed, size-bounded LRU cache
+# -----------------------------------------------------------------------------
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and drop markdown emphasis so equal speech gets one key."""
+    return re.sub(r"\s+", " ", text.replace("*", "").replace("#", "")).strip()
+
+def cache_key(text: str, lang: str = "en") -> str:
+    return hashlib.sha256(f"{lang}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    MP3 cache keyed by a hash of (language, normalized text). Hot entries are
+    kept in memory as bytes; everything is also spilled to a cache directory.
+    Both tiers evict least recently used entries beyond their size limit.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR,
+                 memory_limit: int = AUDIO_CACHE_MEMORY_BYTES,
+                 disk_limit: int = AUDIO_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> size
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(directory, exist_ok=True)
+        self._scan_disk()
+
+    def _scan_disk(self):
+        # Rebuild the disk LRU from the files left by earlier runs, oldest first
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".mp3"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def get(self, text: str, lang: str = "en") -> Optional[bytes]:
+        key = cache_key(text, lang)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            self._put_memory(key, data)
+        return data
+
+    def put(self, text: str, data: bytes, lang: str = "en"):
+        key = cache_key(text, lang)
+        # Write to a temp file first so readers never see a partial MP3
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            self._put_memory(key, data)
+            self._evict_disk()
+
+    def get_or_create(self, text: str, synthesize: Callable[[str, str], bytes], lang: str = "en") -> bytes:
+        """Return cached audio, calling 'synthesize(text, lang)' once on a miss."""
+        data = self.get(text, lang)
+        if data is not None:
+            return data
+        key = cache_key(text, lang)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Concurrent misses for the same text wait for one synthesis
+        with key_lock:
+            data = self.get(text, lang)
+            if data is None:
+                data = synthesize(text, lang)
+                self.put(text, data, lang)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return data
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_limit:
+            return
+        self._memory_bytes -= len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_limit and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._memory_bytes -= len(self._memory.pop(key, b""))
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_audio_cache() -> AudioCache:
+    """Returns the process-wide audio cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AudioCache()
+        return _cache
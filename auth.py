@@ -1,95 +1,181 @@
 # auth.py
 import os
-import bcrypt
+import logging
 import numpy as np
-import face_recognition
-from sqlalchemy import create_engine, Column, Integer, String, text, LargeBinary
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.exc import IntegrityError
+import face_store
+import face_profiles
+from face_index import FaceIndex
+from database import User, session_scope
+from user_cache import UserProfile, user_cache
+import metrics
+from auth_pool import password_hasher, email_throttle, ip_throttle, TooManyAttempts
 
-# 1) Initialize database
-DATABASE_URL = "sqlite:///database.db"
-Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
+# Process-wide 1:N face index, filled from the DB on first use
+face_index = FaceIndex()
 
-# 2) Define a User model
-class User(Base):
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    face_encoding = Column(LargeBinary, nullable=True)
+def get_face_index() -> FaceIndex:
+    """
+    Returns the shared face index, loading every stored encoding once: from
+    the FACE_SNAPSHOT file plus users enrolled after it, or from the DB.
+    """
+    if not face_index.loaded:
+        snapshot = None
+        if face_store.FACE_SNAPSHOT and os.path.exists(face_store.FACE_SNAPSHOT):
+            try:
+                snapshot = face_store.open_snapshot(face_store.FACE_SNAPSHOT)
+            except (OSError, ValueError):
+                logging.getLogger(__name__).warning("Ignoring unreadable face snapshot %s", face_store.FACE_SNAPSHOT, exc_info=True)
+        with session_scope() as session:
+            query = session.query(User.id, User.email, User.face_encoding).filter(User.face_encoding.isnot(None))
+            if snapshot is not None:
+                query = query.filter(User.id > snapshot.max_user_id)
+            rows = query.all()
+        face_index.load(rows, snapshot=snapshot)
+    return face_index
 
-# 3) Create tables if they don't exist
-Base.metadata.create_all(engine)
+def load_new_faces(index: FaceIndex) -> int:
+    """
+    Add faces enrolled since the index last read the DB, e.g. by the API
+    process or bulk_enroll.py. Returns the number added.
+    """
+    with session_scope() as session:
+        rows = (
+            session.query(User.id, User.email, User.face_encoding)
+            .filter(User.id > index.loaded_through, User.face_encoding.isnot(None))
+            .all()
+        )
+    return index.load_more(rows)
 
-# 4) Functions to sign up and log in
+# Functions to sign up and log in
 def signup_user(email: str, password: str, face_encoding: bytes = None) -> bool:
     """
     Creates a new user in the DB. Returns True on success, False if user already exists.
+    'face_encoding' may be in any face_store format; it is stored in FACE_ENCODING_FORMAT.
     """
-    session = SessionLocal()
-    try:
+    if face_encoding:
+        face_encoding = face_store.pack(face_store.unpack(face_encoding))
+    with session_scope() as session:
         # Check if the user already exists
-        existing_user = session.query(User).filter_by(email=email).first()
-        if existing_user:
+        if session.query(User.id).filter_by(email=email).first():
             return False
-        
-        # Hash the password using bcrypt
-        hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        user = User(email=email, password_hash=hashed_pw.decode('utf-8'), face_encoding=face_encoding)
-        session.add(user)
-        session.commit()
-        return True
-    finally:
-        session.close()
-
-
-def login_user(email: str, password: str) -> bool:
+
+    # Hash the password using bcrypt (on the auth worker pool), outside any
+    # session so a slow hash never holds a pooled connection or a DB lock
+    hashed_pw = password_hasher.hash(password)
+    try:
+        with session_scope() as session:
+            user = User(email=email, password_hash=hashed_pw, face_encoding=face_encoding)
+            session.add(user)
+    except IntegrityError:
+        # Same email signed up while we were hashing
+        return False
+
+    user_cache.put(_profile(user))
+    if face_encoding and face_index.loaded:
+        face_index.add(user.id, email, face_store.unpack(face_encoding))
+    return True
+
+
+def login_user(email: str, password: str, client_ip: str = None) -> bool:
     """
     Verify user credentials. Returns True if valid, else False.
+    Raises TooManyAttempts if the email or client IP is throttled.
     """
-    session = SessionLocal()
-    try:
+    if not email_throttle.allowed(email) or not ip_throttle.allowed(client_ip):
+        raise TooManyAttempts("Too many failed login attempts. Please wait a few minutes and try again.")
+
+    with session_scope() as session:
         user = session.query(User).filter_by(email=email).first()
-        if not user:
-            return False
-        
-        # Compare hashed password
-        return bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8'))
-    finally:
-        session.close()
+        if user:
+            profile, stored_hash = _profile(user), user.password_hash
+    if not user:
+        _record_failure(email, client_ip)
+        return False
+
+    # Compare hashed password; bcrypt runs with no session or connection held
+    if not password_hasher.verify(password, stored_hash):
+        _record_failure(email, client_ip)
+        return False
 
-def login_user_with_face(email: str, face_encoding: np.ndarray) -> bool:
+    # Upgrade the stored hash when the configured work factor changed
+    if password_hasher.needs_rehash(stored_hash):
+        new_hash = password_hasher.hash(password)
+        with session_scope() as session:
+            # Only replace the hash we verified, in case it changed meanwhile
+            session.query(User).filter_by(id=profile.id, password_hash=stored_hash).update({"password_hash": new_hash})
+
+    email_throttle.reset(email)
+    user_cache.put(profile)
+    return True
+
+def _record_failure(email: str, client_ip: str):
+    email_throttle.record_failure(email)
+    ip_throttle.record_failure(client_ip)
+
+def login_user_with_face(email: str, face_encoding: np.ndarray, tolerance: float = None) -> bool:
     """
     Compare 'face_encoding' from camera with the stored face_encoding in DB for user 'email'.
-    Returns True if match, otherwise False.
+    Returns True if match, otherwise False. 'tolerance' defaults to the FACE_PROFILE's.
     """
-    session = SessionLocal()
-    try:
+    if tolerance is None:
+        tolerance = face_profiles.get_profile().tolerance
+    with session_scope() as session:
         user = session.query(User).filter_by(email=email).first()
         if not user or not user.face_encoding:
             # user doesn't exist or hasn't registered a face
             return False
 
         # Convert stored binary back to numpy
-        stored_encoding = np.frombuffer(user.face_encoding, dtype=np.float64)
+        stored_encoding = face_store.unpack(user.face_encoding)
+        profile = _profile(user)
 
-        # Compare using face_recognition
-        results = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)
-        return results[0]  # True if it's a match
-    finally:
-        session.close()
+    # Compare using face_recognition (imported here so dlib only loads when needed)
+    import face_recognition
+    with metrics.timer("face.compare"):
+        results = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=tolerance)
+    if results[0]:  # True if it's a match
+        user_cache.put(profile)
+    return results[0]
 
-def get_user_id_by_email(email: str):
-    """Returns the user's ID for the given email, or None if not found."""
-    session = SessionLocal()
-    try:
+def identify_user_by_face(face_encoding: np.ndarray, tolerance: float = None):
+    """
+    1:N lookup: find the enrolled user whose face is closest to 'face_encoding'.
+    Returns (email, distance) if within 'tolerance' (default: the FACE_PROFILE's), otherwise None.
+    """
+    if tolerance is None:
+        tolerance = face_profiles.get_profile().tolerance
+    index = get_face_index()
+    with metrics.timer("face.identify"):
+        result = index.match(face_encoding, tolerance=tolerance)
+        # A miss may be someone enrolled by another process since we loaded
+        if result is None and load_new_faces(index):
+            result = index.match(face_encoding, tolerance=tolerance)
+    if result is None:
+        return None
+    _, email, distance = result
+    return email, distance
+
+def _profile(user: User) -> UserProfile:
+    return UserProfile(id=user.id, email=user.email, has_face=user.face_encoding is not None)
+
+def get_user_profile(email: str):
+    """Returns the cached UserProfile for 'email', querying the DB only on a miss."""
+    profile = user_cache.get(email)
+    if profile is not None:
+        return profile
+    with session_scope() as session:
         user = session.query(User).filter(User.email == email).first()
-        if user:
-            return user.id
-        else:
+        if not user:
             return None
-    finally:
-        session.close()
\ No newline at end of file
+        profile = _profile(user)
+    user_cache.put(profile)
+    return profile
+
+def get_user_id_by_email(email: str):
+    """Returns the user's ID for the given email, or None if not found."""
+    profile = get_user_profile(email)
+    if profile:
+        return profile.id
+    else:
+        return None
\ No newline at end of file
@@ -0,0 +1,162 @@
+# auth_pool.py
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import metrics
+
+# -----------------------------------------------------------------------------
+# 1. Settings
+# -----------------------------------------------------------------------------
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+AUTH_QUEUE_TIMEOUT = float(os.getenv("AUTH_QUEUE_TIMEOUT", "10"))
+
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "30"))
+# Emails or IPs each throttle remembers; beyond this the least recently failed are forgotten
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+# Reverse proxies in front of the app that append to X-Forwarded-For. Entries
+# left of theirs are sent by the client and can be spoofed.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+
+class TooManyAttempts(Exception):
+    """Raised when an email or client IP is throttled before any hashing is done."""
+
+class AuthBusy(Exception):
+    """Raised when no hashing worker frees up in time."""
+
+# -----------------------------------------------------------------------------
+# 2. Bounded bcrypt worker pool
+# -----------------------------------------------------------------------------
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small worker pool instead of the caller's thread.
+    bcrypt releases the GIL, so the pool size is the number of cores a login
+    spike may use; callers beyond that wait in line instead of piling on CPU.
+    """
+
+    def __init__(self, workers: int = AUTH_WORKERS, rounds: int = BCRYPT_ROUNDS, queue_timeout: float = AUTH_QUEUE_TIMEOUT):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Work queued or running at once; waiting past queue_timeout fails fast
+        self._slots = threading.BoundedSemaphore(workers * 4)
+
+    def _run(self, stage, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            metrics.count("bcrypt.rejected")
+            raise AuthBusy("Too many logins in progress, please try again.")
+        try:
+            # Includes time queued behind other hashes
+            with metrics.timer(stage):
+                return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        hashed = self._run("bcrypt.hash", bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode("utf-8")
+
+    def hash_many(self, passwords):
+        """
+        Hashes a batch (bulk enrollment) straight on the pool, bypassing the
+        interactive queue limit. Returns an iterator of hashes in input order.
+        """
+        salts = [bcrypt.gensalt(rounds=self.rounds) for _ in passwords]
+        hashed = self._executor.map(bcrypt.hashpw, [p.encode("utf-8") for p in passwords], salts)
+        return (h.decode("utf-8") for h in hashed)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run("bcrypt.verify", bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if the stored hash was made with a different cost than configured."""
+        try:
+            return int(password_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+# -----------------------------------------------------------------------------
+# 3. Login attempt throttling
+# -----------------------------------------------------------------------------
+
+class AttemptThrottle:
+    """
+    Sliding-window count of failed attempts per key (email or client IP).
+    Keys are kept in order of their last failure, so expired keys are purged
+    from the front and at most 'max_keys' are held however many distinct
+    emails or IPs an attacker sprays.
+    """
+
+    def __init__(self, max_attempts: int, window: float, max_keys: int = LOGIN_THROTTLE_MAX_KEYS):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> deque:
+        failures = self._failures.get(key)
+        if failures is None:
+            # Only the last max_attempts failures matter for the decision
+            failures = self._failures[key] = deque(maxlen=self.max_attempts)
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        return failures
+
+    def _purge(self, now: float):
+        while self._failures:
+            oldest = next(iter(self._failures.values()))
+            if oldest and oldest[-1] > now - self.window and len(self._failures) <= self.max_keys:
+                break
+            self._failures.popitem(last=False)
+
+    def allowed(self, key: str) -> bool:
+        if not key:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            failures = self._recent(key, now)
+            if not failures:
+                self._failures.pop(key, None)
+            allowed = len(failures) < self.max_attempts
+        if not allowed:
+            metrics.count("login.throttled")
+        return allowed
+
+    def record_failure(self, key: str):
+        if not key:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._recent(key, now).append(now)
+            self._failures.move_to_end(key)
+            self._purge(now)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+def client_ip(forwarded_for: str = None, fallback: str = None) -> str:
+    """The client address as seen by the outermost trusted proxy, else 'fallback'."""
+    hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+    if TRUSTED_PROXY_HOPS and hops:
+        return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return fallback
+
+
+password_hasher = PasswordHasher()
+email_throttle = AttemptThrottle(LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SECONDS)
+ip_throttle = AttemptThrottle(LOGIN_MAX_ATTEMPTS_PER_IP, LOGIN_WINDOW_SECONDS)
@@ -0,0 +1,90 @@
+# availability.py
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from database import Appointment, Specialist, SlotTemplate, session_scope
+
+# Slot labels look like "09:00 AM"
+SLOT_TIME_FORMAT = "%I:%M %p"
+
+# -----------------------------------------------------------------------------
+# 1. Cached specialists and per-specialist daily slot grid
+#    (read once per process; restart the app after editing those tables)
+# -----------------------------------------------------------------------------
+
+_cache_lock = threading.Lock()
+_specialists = None
+_slot_grids = {}
+
+def get_specialists() -> List[str]:
+    """Returns the specialist names, read from the DB once."""
+    global _specialists
+    with _cache_lock:
+        if _specialists is None:
+            with session_scope() as session:
+                _specialists = [name for (name,) in session.query(Specialist.name).order_by(Specialist.id)]
+        return list(_specialists)
+
+def get_slot_grid(specialist: str) -> List[str]:
+    """
+    Returns the time slots a specialist offers each day, in display order.
+    Slot templates with no specialist apply to everyone.
+    """
+    with _cache_lock:
+        grid = _slot_grids.get(specialist)
+        if grid is None:
+            with session_scope() as session:
+                specialist_id = session.query(Specialist.id).filter_by(name=specialist).scalar()
+                rows = (
+                    session.query(SlotTemplate.time_slot)
+                    .filter((SlotTemplate.specialist_id.is_(None)) | (SlotTemplate.specialist_id == specialist_id))
+                    .order_by(SlotTemplate.position, SlotTemplate.id)
+                    .all()
+                )
+            grid = list(OrderedDict.fromkeys(slot for (slot,) in rows))
+            _slot_grids[specialist] = grid
+        return list(grid)
+
+# -----------------------------------------------------------------------------
+# 2. Availability queries
+# -----------------------------------------------------------------------------
+
+def free_slots(specialist: str, start: date = None, days: int = 14) -> Dict[str, List[str]]:
+    """
+    Free slots for 'specialist' over 'days' days from 'start', as
+    {"YYYY-MM-DD": [time_slot, ...]}. Booked slots for the whole range are
+    fetched in a single query on the (specialist, date, time_slot) index.
+    """
+    start = start or date.today()
+    day_keys = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    grid = get_slot_grid(specialist)
+
+    with session_scope() as session:
+        booked = set(
+            session.query(Appointment.date, Appointment.time_slot)
+            .filter(
+                Appointment.specialist == specialist,
+                Appointment.date >= day_keys[0],
+                Appointment.date <= day_keys[-1],
+            )
+            .all()
+        )
+
+    now = datetime.now()
+    return OrderedDict(
+        (day, [slot for slot in grid if (day, slot) not in booked and not slot_has_passed(day, slot, now)])
+        for day in day_keys
+    )
+
+def slot_has_passed(day: str, time_slot: str, now: datetime = None) -> bool:
+    """True if the slot on 'day' ("YYYY-MM-DD") starts before 'now'. Unparsable labels never pass."""
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    if day != today:
+        return day < today
+    try:
+        return datetime.strptime(time_slot, SLOT_TIME_FORMAT).time() <= now.time()
+    except ValueError:
+        return False
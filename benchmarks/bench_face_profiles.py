@@ -0,0 +1,140 @@
+# benchmarks/bench_face_profiles.py
+"""
+Per-profile face encoding latency and accuracy on a local labeled image set.
+
+The image set is one directory per person (e.g. an LFW subset or consented
+photos of staff):
+
+    faces/alice/1.jpg  faces/alice/2.jpg  faces/bob/1.jpg ...
+
+For each profile every image goes through the same steps as the face worker
+(decode, quality gate, detection, largest-face encoding). The first usable
+image per person is enrolled; every other image is a probe. Reports latency
+percentiles, failures to encode, the false-reject rate (a probe not matched
+to its own person) and the false-accept rate (a probe matched to anyone
+else) at the profile's tolerance, plus a small tolerance sweep.
+
+    python benchmarks/bench_face_profiles.py faces --profiles fast balanced accurate
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import face_quality
+import face_profiles
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def load_labeled_images(root: str, per_person: int):
+    """[(person, path)] with at most 'per_person' images for each person directory."""
+    images = []
+    for person in sorted(os.listdir(root)):
+        folder = os.path.join(root, person)
+        if not os.path.isdir(folder):
+            continue
+        files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+        images += [(person, os.path.join(folder, f)) for f in files[:per_person]]
+    return images
+
+def encode_all(face_recognition, images, profile, skip_quality: bool):
+    """Returns ([(person, encoding or None)], latencies in seconds, failure counts)."""
+    encoded, latencies, failures = [], [], {}
+    for person, path in images:
+        img = face_recognition.load_image_file(path)  # Decoding is the same for every profile
+        start = time.perf_counter()
+        encoding, failure = None, None
+        if not skip_quality:
+            failure = face_quality.check(img)
+        if failure is None:
+            locations = face_profiles.face_locations(face_recognition, img, profile)
+            if locations:
+                encoding = face_profiles.face_encoding(face_recognition, img, face_quality.largest_face(locations), profile)
+            else:
+                failure = "no_face"
+        latencies.append(time.perf_counter() - start)
+        if failure:
+            failures[failure] = failures.get(failure, 0) + 1
+        encoded.append((person, encoding))
+    return encoded, latencies, failures
+
+def error_rates(encoded, tolerance: float):
+    """
+    1:N over the enrolled templates, as identify_user_by_face does.
+    FRR: probes not accepted as their own person (including failures to encode).
+    FAR: probes accepted as someone else.
+    """
+    templates = {}
+    probes = []
+    for person, encoding in encoded:
+        if person not in templates and encoding is not None:
+            templates[person] = encoding
+        else:
+            probes.append((person, encoding))
+    people = list(templates)
+    if not people:
+        return {"enrolled": 0, "probes": len(probes), "frr": float("nan"), "far": float("nan")}
+    matrix = np.array([templates[p] for p in people])
+    false_rejects = false_accepts = genuine = 0
+    for person, encoding in probes:
+        if person in templates:
+            genuine += 1
+        if encoding is None:
+            false_rejects += person in templates
+            continue
+        distances = np.linalg.norm(matrix - encoding, axis=1)
+        best = int(np.argmin(distances))
+        accepted = distances[best] <= tolerance
+        if accepted and people[best] != person:
+            false_accepts += 1
+        if person in templates and not (accepted and people[best] == person):
+            false_rejects += 1
+    return {
+        "enrolled": len(templates),
+        "probes": len(probes),
+        "frr": false_rejects / genuine if genuine else float("nan"),
+        "far": false_accepts / len(probes) if probes else float("nan"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("images", help="directory with one sub-directory of images per person")
+    parser.add_argument("--profiles", nargs="+", default=sorted(face_profiles.PROFILES), choices=sorted(face_profiles.PROFILES))
+    parser.add_argument("--per-person", type=int, default=10, help="max images per person")
+    parser.add_argument("--skip-quality", action="store_true", help="measure without the quality gate")
+    parser.add_argument("--sweep", type=float, nargs="*", default=[0.45, 0.5, 0.55, 0.6, 0.65],
+                        help="extra tolerances to report FAR/FRR at")
+    args = parser.parse_args()
+
+    import face_recognition
+    images = load_labeled_images(args.images, args.per_person)
+    print(f"{len(images)} images of {len({p for p, _ in images})} people")
+
+    print(f"{'profile':<10} {'p50 ms':>9} {'p95 ms':>9} {'no enc':>7} {'tol':>5} {'FRR':>7} {'FAR':>7}")
+    for name in args.profiles:
+        profile = face_profiles.get_profile(name)
+        encoded, latencies, failures = encode_all(face_recognition, images, profile, args.skip_quality)
+        rates = error_rates(encoded, profile.tolerance)
+        print(f"{name:<10} {statistics.median(latencies) * 1000:>9.1f} {percentile(latencies, 95) * 1000:>9.1f} "
+              f"{sum(failures.values()):>7} {profile.tolerance:>5.2f} {rates['frr']:>7.3f} {rates['far']:>7.3f}")
+        if failures:
+            print(f"{'':<10} failures: {failures}")
+        for tolerance in args.sweep:
+            if tolerance != profile.tolerance:
+                swept = error_rates(encoded, tolerance)
+                print(f"{'':<10} {'':>9} {'':>9} {'':>7} {tolerance:>5.2f} {swept['frr']:>7.3f} {swept['far']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
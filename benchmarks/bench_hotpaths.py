@@ -0,0 +1,239 @@
+# benchmarks/bench_hotpaths.py
+"""
+Offline benchmark of the app's hot paths.
+
+Drives the real functions in auth.py, book_appointment.py and the Chat send
+flow against a temporary SQLite database, with local stand-ins for Gemini,
+gTTS and the camera (synthetic face encodings), so it needs no network.
+Reports p50/p95 latency and throughput per user-table size and concurrency.
+
+    python benchmarks/bench_hotpaths.py --sizes 100 1000 10000 --concurrency 1 4 16
+"""
+import os
+import sys
+import time
+import types
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# -----------------------------------------------------------------------------
+# 1. Local stand-ins for Gemini, gTTS and face_recognition
+# -----------------------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeChat:
+    def __init__(self, history, latency):
+        self.history = list(history)
+        self.latency = latency
+
+    def send_message(self, message, stream=False):
+        time.sleep(self.latency)
+        reply = (f"I understand you are saying: {message}. That sounds uncomfortable. "
+                 "I would suggest seeing a General Physician first. Please book the appointment "
+                 "in our website under the 'Book Appointment' section.")
+        self.history += [{"role": "user", "parts": [message]}, {"role": "model", "parts": [reply]}]
+        if stream:
+            return [FakeResponse(reply[i:i + 40]) for i in range(0, len(reply), 40)]
+        return FakeResponse(reply)
+
+def install_fakes(llm_latency: float, tts_latency: float):
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+
+    class GenerativeModel:
+        def __init__(self, model_name, generation_config=None):
+            pass
+
+        def start_chat(self, history=None):
+            return FakeChat(history or [], llm_latency)
+
+    genai.GenerativeModel = GenerativeModel
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.generativeai = genai
+    sys.modules["google"] = google
+    sys.modules["google.generativeai"] = genai
+
+    gtts = types.ModuleType("gtts")
+
+    class gTTS:
+        def __init__(self, text, lang="en"):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            time.sleep(tts_latency)
+            fp.write(b"ID3" + self.text.encode("utf-8")[:2048])
+
+    gtts.gTTS = gTTS
+    sys.modules["gtts"] = gtts
+
+    face_recognition = types.ModuleType("face_recognition")
+
+    def face_distance(known, probe):
+        return np.linalg.norm(np.asarray(known) - probe, axis=1) if len(known) else np.empty(0)
+
+    face_recognition.face_distance = face_distance
+    face_recognition.compare_faces = lambda known, probe, tolerance=0.6: list(face_distance(known, probe) <= tolerance)
+    sys.modules["face_recognition"] = face_recognition
+
+def synthetic_encoding(seed: int) -> np.ndarray:
+    # Stand-in for a camera frame run through dlib: a stable 128-d vector per person
+    return np.random.default_rng(seed).normal(0, 0.1, 128)
+
+# -----------------------------------------------------------------------------
+# 2. Measurement helpers
+# -----------------------------------------------------------------------------
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def measure(fn, args_list, concurrency):
+    latencies = []
+
+    def timed(args):
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, args_list))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "ops_s": len(latencies) / elapsed,
+    }
+
+# -----------------------------------------------------------------------------
+# 3. Scenarios
+# -----------------------------------------------------------------------------
+
+def grow_users(target: int, password_hash: str):
+    """Bulk-insert synthetic users (every other one with a face) up to 'target' rows."""
+    from database import User, session_scope
+    with session_scope() as session:
+        current = session.query(User).count()
+        session.bulk_insert_mappings(User, [
+            {
+                "email": f"patient{i}@example.com",
+                "password_hash": password_hash,
+                "face_encoding": synthetic_encoding(i).tobytes() if i % 2 == 0 else None,
+            }
+            for i in range(current, target)
+        ])
+    return target
+
+def chat_send(user_id: int, email: str, message: str):
+    """The Chat page's non-streaming Send flow, minus Streamlit rendering."""
+    import conversation_store
+    import response_cache
+    import speech
+    from chat_sessions import get_chat_manager
+
+    first_turn = not conversation_store.recent_messages(user_id, 1)
+    cached_reply = response_cache.get(message) if first_turn else None
+    conversation_store.add_message(user_id, "user", message)
+    if cached_reply is not None:
+        reply = cached_reply
+        get_chat_manager().record(email, message, reply)
+    else:
+        reply = get_chat_manager().send(email, message)
+        if first_turn:
+            response_cache.put(message, reply)
+    conversation_store.add_message(user_id, "ai", reply)
+    speech.synthesize(reply)
+
+def run(args):
+    import auth
+    import book_appointment
+    from auth_pool import password_hasher
+    from availability import get_specialists, get_slot_grid
+    from user_cache import user_cache
+
+    password_hash = password_hasher.hash("benchmark-password")
+    specialists, slots = get_specialists(), get_slot_grid(get_specialists()[0])
+    messages = ["I have a headache", "chest pain what doctor", "my knee hurts when I walk",
+                "I have a rash on my arm", "my child has a fever"]
+    signup_counter = [0]
+
+    print(f"{'users':>7} {'conc':>5} {'scenario':<26} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>9}")
+    for size in sorted(args.sizes):
+        grow_users(size, password_hash)
+        auth.face_index.loaded = False  # Pick up the bulk-inserted faces
+        auth.get_face_index()
+        for concurrency in args.concurrency:
+            n = args.ops
+            picks = [random.randrange(size) for _ in range(n)]
+            face_picks = [p - p % 2 for p in picks]
+            # Distinct users, so every cold lookup really misses the cache
+            cold_picks = random.sample(range(size), min(n, size))
+
+            def signup_args():
+                signup_counter[0] += n
+                return [(f"new{signup_counter[0] - n + i}@example.com", "benchmark-password",
+                         synthetic_encoding(10 ** 7 + signup_counter[0] - n + i).tobytes()) for i in range(n)]
+
+            # (name, function, argument tuples, setup run before timing or None)
+            scenarios = [
+                ("signup_user", auth.signup_user, signup_args(), None),
+                ("login_user", auth.login_user, [(f"patient{p}@example.com", "benchmark-password") for p in picks], None),
+                ("login_user_with_face", auth.login_user_with_face,
+                 [(f"patient{p}@example.com", synthetic_encoding(p) + 0.001) for p in face_picks], None),
+                ("identify_user_by_face", auth.identify_user_by_face, [(synthetic_encoding(p) + 0.001,) for p in face_picks], None),
+                # The scenarios above fill the profile cache; measure the DB lookup and the cache hit separately
+                ("get_user_id_by_email_cold", auth.get_user_id_by_email,
+                 [(f"patient{p}@example.com",) for p in cold_picks], user_cache.clear),
+                ("get_user_id_by_email", auth.get_user_id_by_email, [(f"patient{p}@example.com",) for p in cold_picks], None),
+                ("book_appointment", book_appointment.reserve_appointment,
+                 [(p + 1, random.choice(specialists), f"2030-01-{random.randint(1, 28):02d}", random.choice(slots)) for p in picks], None),
+                ("chat_send", chat_send,
+                 [(p + 1, f"patient{p}@example.com", random.choice(messages)) for p in picks], None),
+            ]
+            for name, fn, args_list, setup in scenarios:
+                if args.only and name not in args.only:
+                    continue
+                if setup:
+                    setup()
+                result = measure(fn, args_list, concurrency)
+                print(f"{size:>7} {concurrency:>5} {name:<26} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['ops_s']:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="user-table sizes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ops", type=int, default=50, help="operations per scenario and level")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated Gemini latency (s)")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="simulated gTTS latency (s)")
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="medidot-bench-")
+    # Must be set before the app modules read their settings at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["AUDIO_CACHE_DIR"] = os.path.join(tmp, "tts")
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("LOGIN_MAX_ATTEMPTS_PER_IP", "1000000")
+    install_fakes(args.llm_latency, args.tts_latency)
+    sys.path.insert(0, ROOT)
+    random.seed(0)
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
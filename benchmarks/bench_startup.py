@@ -0,0 +1,187 @@
+# benchmarks/bench_startup.py
+"""
+Startup / rerun cost of the Streamlit script.
+
+Cold start runs app.py once in a fresh interpreter (imports, schema check,
+cached resources). Then every page is opened and rerun in one session, the
+way Streamlit reruns the script on each widget interaction, and the Chat
+send/exit and Log Out actions are timed. Gemini and gTTS are replaced by the
+local stand-ins from bench_hotpaths.py. A run that does not finish within
+--timeout (e.g. a cached resource blocked on its own lock) fails the benchmark.
+
+    python benchmarks/bench_startup.py --reruns 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ScriptHung(RuntimeError):
+    """The script did not finish in time, e.g. blocked on a cache lock."""
+
+
+class AppSession:
+    """
+    Drives app.py through Streamlit's own script runner with one persistent
+    session, so widget values and st.session_state carry over between runs
+    and every page (not just the default one) can be executed and timed.
+    """
+
+    def __init__(self, timeout: float):
+        from streamlit.runtime.state.session_state import SessionState
+        self.timeout = timeout
+        self.session_state = SessionState()
+        self.tree = None
+
+    def run(self, **session_values) -> float:
+        """Run the script once with the current widget values; returns seconds."""
+        from streamlit.testing.local_script_runner import LocalScriptRunner
+        from streamlit.testing.element_tree import parse_tree_from_messages
+        from streamlit.runtime.scriptrunner import RerunData
+
+        runner = LocalScriptRunner(APP)
+        # Share one SessionState across runs (LocalScriptRunner would deepcopy it)
+        runner.session_state = runner._session_state = self.session_state
+        for key, value in session_values.items():
+            self.session_state[key] = value
+        widget_states = self.tree.get_widget_states() if self.tree is not None else None
+
+        start = time.perf_counter()
+        runner.request_rerun(RerunData(widget_states=widget_states))
+        runner.start()
+        runner._script_thread.join(self.timeout)
+        elapsed = time.perf_counter() - start
+        if runner._script_thread.is_alive():
+            raise ScriptHung(f"app.py did not finish within {self.timeout}s")
+        if runner.script_thread_exceptions:
+            raise runner.script_thread_exceptions[0]
+        self.tree = parse_tree_from_messages(runner.forward_msgs())
+        self.tree.script_path, self.tree._session_state = APP, self.session_state
+        errors = [e.value for e in self.tree.get("exception")]
+        if errors:
+            raise RuntimeError(f"app.py raised: {errors[0]}")
+        return elapsed
+
+    def widget(self, kind: str, label: str):
+        for widget in self.tree.get(kind):
+            if widget.label == label:
+                return widget
+        raise LookupError(f"No {kind} labelled {label!r} on this page")
+
+    def go_to(self, page: str) -> float:
+        self.widget("selectbox", "Navigate").select(page)
+        return self.run()
+
+
+def setup_runtime():
+    # The minimal runtime Streamlit's script tests use: in-memory caches, no server
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    config.set_option("runner.postScriptGC", False)
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+
+def run_script(reruns: int, timeout: float) -> dict:
+    # Executed in the child process: time the first run, then every page and
+    # the chat interactions, with local stand-ins for Gemini and gTTS
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    setup_runtime()  # Imports streamlit (and google.protobuf) before the fake google.generativeai
+    from bench_hotpaths import install_fakes
+    install_fakes(llm_latency=0.0, tts_latency=0.0)
+
+    from auth import signup_user, get_user_profile
+    signup_user("bench@example.com", "benchmark-password")
+
+    app = AppSession(timeout)
+    result = {"first_run": app.run(), "pages": {}, "interactions": {}}
+    logged_in = {"logged_in": True, "user_email": "bench@example.com",
+                 "user_id": get_user_profile("bench@example.com").id}
+    for page in ("Sign Up", "Login", "Chat", "Book Appointment"):
+        times = [app.go_to(page)]
+        for key, value in logged_in.items():
+            app.session_state[key] = value
+        times += [app.run() for _ in range(reruns)]
+        result["pages"][page] = times
+
+    # Chat: send a message (non-streaming and streaming), then "exit"
+    app.go_to("Chat")
+    for name, text, stream in (("chat send", "I have a headache", False),
+                               ("chat send (stream)", "my knee hurts", True),
+                               ("chat exit", "exit", False)):
+        app.widget("text_input", "Enter your message:").input(text)
+        checkbox = app.widget("checkbox", "Stream replies")
+        checkbox.check() if stream else checkbox.uncheck()
+        app.widget("button", "Send").click()
+        result["interactions"][name] = app.run()
+
+    app.go_to("Book Appointment")
+    app.widget("button", "Log Out").click()
+    result["interactions"]["log out"] = app.run()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20, help="reruns per page")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a run counts as hung")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        try:
+            print(json.dumps(run_script(args.reruns, args.timeout)))
+        except ScriptHung as e:
+            # The stuck script thread would keep the interpreter alive
+            print(f"ScriptHung: {e}", file=sys.stderr, flush=True)
+            os._exit(1)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   AUDIO_CACHE_DIR=os.path.join(tmp, "tts"))
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, __file__, "--child", "--reruns", str(args.reruns),
+                              "--timeout", str(args.timeout)],
+                             cwd=tmp, env=env, capture_output=True, text=True)
+        if out.returncode:
+            sys.exit(f"Benchmark run failed:\n{out.stderr[-3000:]}")
+        cold_start = time.perf_counter() - start
+
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    print(f"cold start (interpreter + first run): {cold_start * 1000:8.1f} ms")
+    print(f"first script run:                     {result['first_run'] * 1000:8.1f} ms")
+    print(f"{'page':<20} {'switch ms':>10} {'rerun p50':>10} {'rerun p95':>10}")
+    for page, times in result["pages"].items():
+        reruns = times[1:] or times
+        print(f"{page:<20} {times[0] * 1000:>10.2f} {statistics.median(reruns) * 1000:>10.2f} {percentile(reruns, 95) * 1000:>10.2f}")
+    for name, seconds in result["interactions"].items():
+        print(f"{name:<20} {seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
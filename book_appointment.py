@@ -1,74 +1,150 @@
 # book_appointment.py
 
-from sqlalchemy import Column, Integer, String, ForeignKey, LargeBinary
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy import create_engine
-import os
+import time
+import random
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
 
-# -----------------------------------------------------------------------------
-# 1. Initialize Database (reuse or match your existing setup)
-# -----------------------------------------------------------------------------
+from sqlalchemy.exc import IntegrityError, OperationalError
 
-DATABASE_URL = "sqlite:///database.db"  # or your actual DB path
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
+import metrics
+from database import Appointment, session_scope
+from availability import free_slots, get_slot_grid, get_specialists, slot_has_passed
 
-Base = declarative_base()
+MAX_BUSY_RETRIES = 5
+BUSY_BACKOFF_SECONDS = 0.05
 
-# -----------------------------------------------------------------------------
-# 2. Existing 'users' table from your schema (reference only)
-# -----------------------------------------------------------------------------
+class BookingResult(NamedTuple):
+    # "booked", "duplicate" (same idempotency key already booked) or "taken"
+    status: str
+    appointment: Optional[Appointment]
+    # Nearest open (date, time_slot) pairs when the slot was taken
+    alternatives: List[Tuple[str, str]]
 
-class User(Base):
-    __tablename__ = "users"
+class SlotTakenError(Exception):
+    def __init__(self, alternatives):
+        super().__init__("That slot has just been taken.")
+        self.alternatives = alternatives
 
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    face_encoding = Column(LargeBinary, nullable=True)
+class InvalidBooking(ValueError):
+    """Raised for an unknown specialist, a malformed or past date, or a slot the specialist does not offer."""
 
-    # If you want a backref relationship:
-    appointments = relationship("Appointment", back_populates="user")
+class _SlotClash(Exception):
+    """Another appointment holds the slot (found by the in-transaction check)."""
+
+def validate_booking(specialist, date, time_slot):
+    """Raises InvalidBooking unless the request names a real, future slot."""
+    if not all(isinstance(value, str) for value in (specialist, date, time_slot)):
+        raise InvalidBooking("specialist, date and time_slot must be strings.")
+    if specialist not in get_specialists():
+        raise InvalidBooking(f"Unknown specialist {specialist!r}.")
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise InvalidBooking("date must be formatted as YYYY-MM-DD.")
+    # Dates are stored and compared as strings, so only the canonical form is accepted
+    if day.strftime("%Y-%m-%d") != date:
+        raise InvalidBooking("date must be formatted as YYYY-MM-DD.")
+    if time_slot not in get_slot_grid(specialist):
+        raise InvalidBooking(f"{specialist} does not offer a {time_slot!r} slot.")
+    if slot_has_passed(date, time_slot):
+        raise InvalidBooking("That slot is in the past.")
 
 # -----------------------------------------------------------------------------
-# 3. New 'appointments' table
+# 1. Reserve a slot (concurrency safe, idempotent)
 # -----------------------------------------------------------------------------
+def reserve_appointment(user_id: int, specialist: str, date: str, time_slot: str,
+                        idempotency_key: str = None) -> BookingResult:
+    """
+    Book a slot. The unique (specialist, date, time_slot) index decides races
+    between patients, so no global lock is needed; the loser gets the nearest
+    open alternatives. Re-sending the same idempotency_key (per user) returns
+    the original booking instead of a duplicate. SQLite busy errors are retried
+    a bounded number of times. Raises InvalidBooking for requests that do
+    not name a real, future slot.
+    """
+    validate_booking(specialist, date, time_slot)
+    if idempotency_key:
+        # Stored per user, so one patient's key can never match another's booking
+        idempotency_key = f"{user_id}:{idempotency_key}"
+    for attempt in range(MAX_BUSY_RETRIES):
+        try:
+            with metrics.timer("booking.reserve"), session_scope() as db:
+                if idempotency_key:
+                    existing = db.query(Appointment).filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+                    if existing:
+                        return BookingResult("duplicate", existing, [])
+                new_appt = Appointment(
+                    user_id=user_id,
+                    specialist=specialist,
+                    date=date,
+                    time_slot=time_slot,
+                    idempotency_key=idempotency_key,
+                )
+                db.add(new_appt)
+                # Flushing takes the write lock; any other row for the slot now
+                # is a clash. This still guards double-booking on legacy DBs
+                # where the unique index could not be built.
+                db.flush()
+                clash = (
+                    db.query(Appointment.id)
+                    .filter_by(specialist=specialist, date=date, time_slot=time_slot)
+                    .filter(Appointment.id != new_appt.id)
+                    .first()
+                )
+                if clash:
+                    raise _SlotClash()
+            return BookingResult("booked", new_appt, [])
+        except (IntegrityError, _SlotClash):
+            # Either the slot was taken or a concurrent retry used the same key
+            if idempotency_key:
+                with session_scope() as db:
+                    existing = db.query(Appointment).filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+                if existing:
+                    return BookingResult("duplicate", existing, [])
+            return BookingResult("taken", None, nearest_alternatives(specialist, date, time_slot))
+        except OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            if attempt == MAX_BUSY_RETRIES - 1:
+                raise
+            metrics.count("booking.busy_retries")
+            time.sleep(BUSY_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random()))
 
-class Appointment(Base):
-    __tablename__ = "appointments"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    specialist = Column(String, nullable=False)
-    date = Column(String, nullable=False)
-    time_slot = Column(String, nullable=False)
+def nearest_alternatives(specialist: str, date: str, time_slot: str, limit: int = 3, days: int = 7):
+    """Open slots closest to the requested one, searching a few days either side."""
+    grid = get_slot_grid(specialist)
+    wanted_day = datetime.strptime(date, "%Y-%m-%d").date()
+    wanted_pos = grid.index(time_slot) if time_slot in grid else 0
+    today = datetime.now().date()
+    start = max(today, wanted_day - timedelta(days=days))
 
-    # Relationship back to User
-    user = relationship("User", back_populates="appointments")
+    candidates = []
+    for day, open_slots in free_slots(specialist, start, (wanted_day - start).days + days + 1).items():
+        day_offset = abs((datetime.strptime(day, "%Y-%m-%d").date() - wanted_day).days)
+        for slot in open_slots:
+            candidates.append((day_offset, abs(grid.index(slot) - wanted_pos), day, slot))
+    candidates.sort()
+    return [(day, slot) for _, _, day, slot in candidates[:limit]]
 
 # -----------------------------------------------------------------------------
-# 4. Create tables if they don't exist
+# 2. Function to book an appointment
 # -----------------------------------------------------------------------------
-Base.metadata.create_all(engine)
-
-# -----------------------------------------------------------------------------
-# 5. Function to book an appointment
-# -----------------------------------------------------------------------------
-def book_appointment(user_id: int, specialist: str, date: str, time_slot: str):
+def book_appointment(user_id: int, specialist: str, date: str, time_slot: str, idempotency_key: str = None):
     
     # Create a new appointment in the database, linked to the user by user_id.
+    # Raises SlotTakenError (with alternatives) if someone else holds the slot,
+    # or InvalidBooking if the slot does not exist or has passed.
 
-    db = SessionLocal()
-    try:
-        new_appt = Appointment(
-            user_id=user_id,
-            specialist=specialist,
-            date=date,
-            time_slot=time_slot
-        )
-        db.add(new_appt)
-        db.commit()
-        db.refresh(new_appt)
-        return new_appt
-    finally:
-        db.close()
+    result = reserve_appointment(user_id, specialist, date, time_slot, idempotency_key)
+    if result.status == "taken":
+        raise SlotTakenError(result.alternatives)
+    return result.appointment
+
+# -----------------------------------------------------------------------------
+# 3. Function to list a user's appointments
+# -----------------------------------------------------------------------------
+def get_user_appointments(user_id: int):
+    """Returns all appointments booked by the given user."""
+    with session_scope() as db:
+        return db.query(Appointment).filter_by(user_id=user_id).all()
@@ -0,0 +1,216 @@
+# bulk_enroll.py
+"""
+Bulk patient enrollment from a CSV of emails, credentials and face images.
+
+    python bulk_enroll.py patients.csv --report enroll_report.csv
+
+CSV columns (header row required): email, password, invite_token, image_path.
+Each row needs a password or an invite token; an invite token is stored as
+the patient's initial password. Relative image paths are resolved against
+the CSV's directory.
+
+Face encodings are computed on a process pool, passwords are hashed on the
+bcrypt worker pool, and users are inserted in chunked executemany
+transactions. Emails already in the database are skipped, so an interrupted
+run can simply be started again. Rows whose image has no face, several
+faces, fails the quality check or cannot be read are written to the report and not enrolled.
+Rows already in the report are skipped on later runs unless --retry-failed
+is given (e.g. after replacing the images in place); a changed image_path is
+always tried again.
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+import face_store
+import face_quality
+import face_profiles
+from database import User, session_scope, init_db
+from auth_pool import PasswordHasher, AUTH_WORKERS
+
+REPORT_FIELDS = ["email", "image_path", "status", "detail"]
+# Report statuses that a rerun would only reproduce
+FAILED_STATUSES = {"invalid_row", "unreadable", "low_quality", "no_face", "multiple_faces"}
+
+# -----------------------------------------------------------------------------
+# 1. Worker side (runs inside the pool processes)
+# -----------------------------------------------------------------------------
+
+_face_recognition = None
+_profile = None
+
+def _init_worker(profile: face_profiles.FaceProfile):
+    global _face_recognition, _profile
+    import face_recognition
+    _face_recognition = face_recognition
+    _profile = profile
+
+def _encode_file(path: str):
+    """Returns (status, detail, encoding bytes or None) for one image."""
+    try:
+        img = _face_recognition.load_image_file(path)
+    except Exception as e:
+        return "unreadable", str(e), None
+    rejected = face_quality.check(img)
+    if rejected:
+        return "low_quality", rejected, None
+    # Detect once and reuse the boxes, instead of detecting again inside face_encodings
+    locations = face_profiles.face_locations(_face_recognition, img, _profile)
+    if not locations:
+        return "no_face", "", None
+    if len(locations) > 1:
+        return "multiple_faces", f"{len(locations)} faces", None
+    encoding = face_profiles.face_encoding(_face_recognition, img, locations[0], _profile)
+    return "ok", "", face_store.pack(encoding)
+
+# -----------------------------------------------------------------------------
+# 2. Input and resume state
+# -----------------------------------------------------------------------------
+
+def read_rows(csv_path: str):
+    """Yields (email, credential, image_path, problem) per CSV row."""
+    base = os.path.dirname(os.path.abspath(csv_path))
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            email = (row.get("email") or "").strip()
+            credential = row.get("password") or row.get("invite_token") or ""
+            image_path = (row.get("image_path") or "").strip()
+            if image_path and not os.path.isabs(image_path):
+                image_path = os.path.join(base, image_path)
+            problem = None
+            if not email:
+                problem = "missing email"
+            elif not credential:
+                problem = "missing password or invite_token"
+            elif not image_path:
+                problem = "missing image_path"
+            yield email, credential, image_path, problem
+
+def reported_failures(report_path: str) -> set:
+    """(email, image_path) of rows an earlier run reported as not enrollable."""
+    if not os.path.exists(report_path):
+        return set()
+    with open(report_path, newline="", encoding="utf-8") as f:
+        return {(row["email"], row["image_path"]) for row in csv.DictReader(f) if row.get("status") in FAILED_STATUSES}
+
+def existing_emails() -> set:
+    with session_scope() as session:
+        return {email for (email,) in session.query(User.email)}
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# -----------------------------------------------------------------------------
+# 3. Enrollment
+# -----------------------------------------------------------------------------
+
+def insert_users(rows):
+    """
+    Inserts a chunk of {"email", "password_hash", "face_encoding"} dicts in one
+    executemany. Returns the emails that already existed (e.g. signed up
+    while the import ran).
+    """
+    try:
+        with session_scope() as session:
+            session.execute(insert(User), rows)
+        return []
+    except IntegrityError:
+        pass
+    # Someone in this chunk already exists: fall back to one row at a time
+    duplicates = []
+    for row in rows:
+        try:
+            with session_scope() as session:
+                session.execute(insert(User), [row])
+        except IntegrityError:
+            duplicates.append(row["email"])
+    return duplicates
+
+def enroll(args):
+    init_db()
+    done = existing_emails()
+    failed_before = set() if args.retry_failed else reported_failures(args.report)
+    pending, report_rows, seen = [], [], set()
+    skipped = previously_failed = 0
+    for email, credential, image_path, problem in read_rows(args.csv):
+        if (email, image_path) in failed_before:
+            previously_failed += 1
+        elif problem:
+            report_rows.append({"email": email, "image_path": image_path, "status": "invalid_row", "detail": problem})
+        elif email in done or email in seen:
+            skipped += 1
+        else:
+            seen.add(email)
+            pending.append((email, credential, image_path))
+    print(f"{len(pending)} to enroll, {skipped} already enrolled, {len(report_rows)} invalid rows, "
+          f"{previously_failed} already reported")
+
+    report_exists = os.path.exists(args.report)
+    with open(args.report, "a", newline="", encoding="utf-8") as report_file:
+        report = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+        if not report_exists:
+            report.writeheader()
+        report.writerows(report_rows)
+
+        # Imported invite tokens get the configured cost on the patient's first login (rehash-on-login)
+        hasher = PasswordHasher(workers=args.hash_workers, rounds=args.bcrypt_rounds)
+        counts = {}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(face_profiles.get_profile(args.profile),)) as face_pool:
+            for chunk in chunks(pending, args.chunk_size):
+                # Encode and hash the chunk at the same time; bcrypt releases the GIL
+                hashes = hasher.hash_many([credential for _, credential, _ in chunk])
+                results = face_pool.map(_encode_file, [image_path for _, _, image_path in chunk],
+                                        chunksize=max(1, len(chunk) // (args.workers * 4)))
+                users = []
+                for (email, _, image_path), password_hash, (status, detail, encoding) in zip(chunk, hashes, results):
+                    if status == "ok":
+                        users.append({"email": email, "password_hash": password_hash, "face_encoding": encoding})
+                    else:
+                        counts[status] = counts.get(status, 0) + 1
+                        report.writerow({"email": email, "image_path": image_path, "status": status, "detail": detail})
+                duplicates = insert_users(users) if users else []
+                for email in duplicates:
+                    report.writerow({"email": email, "image_path": "", "status": "already_exists", "detail": ""})
+                counts["enrolled"] = counts.get("enrolled", 0) + len(users) - len(duplicates)
+                if duplicates:
+                    counts["already_exists"] = counts.get("already_exists", 0) + len(duplicates)
+                report_file.flush()
+
+                processed = sum(counts.values())
+                rate = processed / (time.perf_counter() - start)
+                print(f"{processed}/{len(pending)} processed ({rate:.1f}/s) {counts}", flush=True)
+        hasher.shutdown()
+
+    print(f"Done: {counts}. Problem rows are in {args.report}.")
+    print("Restart running app processes to load the new faces into the face-login index.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk patient enrollment from a CSV of face images")
+    parser.add_argument("csv", help="CSV with email, password, invite_token, image_path columns")
+    parser.add_argument("--report", default="enroll_report.csv", help="CSV of rows that were not enrolled (appended)")
+    parser.add_argument("--retry-failed", action="store_true", help="process rows the report already lists as failed")
+    parser.add_argument("--chunk-size", type=int, default=500, help="users per insert transaction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="face encoding processes")
+    parser.add_argument("--hash-workers", type=int, default=AUTH_WORKERS, help="bcrypt threads")
+    parser.add_argument("--profile", choices=sorted(face_profiles.PROFILES), default=face_profiles.FACE_PROFILE,
+                        help="face encoding profile; use the one the app is deployed with")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                        help="bcrypt cost for imported credentials")
+    args = parser.parse_args()
+    if not os.path.exists(args.csv):
+        sys.exit(f"No such file: {args.csv}")
+    enroll(args)
+
+
+if __name__ == "__main__":
+    main()
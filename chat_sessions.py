@@ -0,0 +1,197 @@
+# chat_sessions.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import metrics
+from api import GEMINI_API_KEY
+from conversation_store import build_history
+
+# -----------------------------------------------------------------------------
+# 1. Model settings and receptionist role-play prompt
+# -----------------------------------------------------------------------------
+
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+GENERATION_CONFIG = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+SYSTEM_HISTORY = [
+    {
+        "role": "user",
+        "parts": [
+            "You are an AI Hospital Receptionist. Your job is to analyse the patient's "
+            "symptoms and redirect to a specialist doctor. You can ask questions to the patient to "
+            "gather more information. Guide them on the next steps to be taken and tell which doctor to meet. "
+            "Suggest which tests are to be done and the specialist to be consulted."
+            "Remember to be empathetic and supportive; and be very friendly. Finally tell the user to book the "
+            "appointment in our website under the 'Book Appointment' section."
+        ],
+    },
+    {
+        "role": "model",
+        "parts": [
+            "Okay, I understand. I'm ready to help. Please, tell me what's been going on. "
+            "What symptoms are you experiencing? The more details you can give me, the better "
+            "I can understand what might be happening. Don't worry, I'm here to listen and "
+            "help you figure this out.\n"
+        ],
+    },
+]
+
+# -----------------------------------------------------------------------------
+# 2. Per-user chat session manager
+# -----------------------------------------------------------------------------
+
+class _Entry:
+    def __init__(self, chat):
+        self.chat = chat
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class ChatSessionManager:
+    """
+    Creates the configured Gemini model once per process and keeps one live
+    chat session per user, so each turn only sends the new message plus a
+    bounded amount of earlier history.
+    """
+
+    def __init__(self, idle_ttl: float = None, max_sessions: int = None, max_history_turns: int = None):
+        self.idle_ttl = idle_ttl or float(os.getenv("CHAT_IDLE_TTL", "1800"))
+        self.max_sessions = max_sessions or int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+        self.max_history_turns = max_history_turns or int(os.getenv("CHAT_MAX_HISTORY_TURNS", "10"))
+        self._model = None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            # Imported on first use so pages without chat don't pay for it
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            self._model = genai.GenerativeModel(
+                model_name=MODEL_NAME,
+                generation_config=GENERATION_CONFIG,
+            )
+        return self._model
+
+    def _get_entry(self, user_key: str, seed_turns: Optional[Callable[[], List[Tuple[str, str]]]] = None) -> _Entry:
+        with self._lock:
+            self._evict_idle()
+            entry = self._sessions.get(user_key)
+            if entry is None:
+                # New or evicted session: rebuild it from the stored conversation
+                history = list(SYSTEM_HISTORY)
+                if seed_turns is not None:
+                    history += build_history(seed_turns(), self.max_history_turns)
+                entry = _Entry(self.model.start_chat(history=history))
+                self._sessions[user_key] = entry
+                # Cap the number of live sessions, dropping the least recently used
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(user_key)
+            entry.last_used = time.monotonic()
+            return entry
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for key in [k for k, e in self._sessions.items() if e.last_used < cutoff]:
+            del self._sessions[key]
+
+    def _trim_history(self, chat):
+        # Keep the role-play prompt, a compact summary of older turns and the
+        # last N user/model turns, so the prompt size stays flat
+        system_len = len(SYSTEM_HISTORY)
+        history = list(chat.history)
+        # Summary block (2 messages) + N turns + one turn of slack before re-summarizing
+        if len(history) - system_len > (self.max_history_turns + 2) * 2:
+            turns = [(content.role, content.parts[0].text) for content in history[system_len:]]
+            chat.history = history[:system_len] + build_history(turns, self.max_history_turns)
+
+    def send(self, user_key: str, message: str, seed_turns=None) -> str:
+        """
+        Send 'message' in the user's chat session and return the reply text.
+        'seed_turns' returns earlier (role, text) turns and is only called
+        when the session has to be (re)created.
+        """
+        entry = self._get_entry(user_key, seed_turns)
+        with entry.lock:
+            try:
+                self._trim_history(entry.chat)
+                with metrics.timer("gemini.send"):
+                    response = entry.chat.send_message(message)
+                return response.text
+            except BaseException:
+                self._discard(user_key, entry)
+                raise
+
+    def stream(self, user_key: str, message: str, seed_turns=None) -> Iterator[str]:
+        """
+        Like send(), but yields the reply text chunk by chunk as the model
+        generates it. The chat history is updated once the stream is consumed.
+        """
+        entry = self._get_entry(user_key, seed_turns)
+        with entry.lock:
+            try:
+                self._trim_history(entry.chat)
+                start = time.perf_counter()
+                first = True
+                response = entry.chat.send_message(message, stream=True)
+                for chunk in response:
+                    if first:
+                        metrics.observe("gemini.first_token", time.perf_counter() - start)
+                        first = False
+                    if chunk.text:
+                        yield chunk.text
+                metrics.observe("gemini.stream", time.perf_counter() - start)
+            except BaseException:
+                # Includes GeneratorExit when a rerun abandons the stream half way
+                self._discard(user_key, entry)
+                raise
+
+    def record(self, user_key: str, message: str, reply: str, seed_turns=None):
+        """
+        Add a turn that was answered without the model (e.g. from the
+        response cache) so later turns still have it as context.
+        """
+        entry = self._get_entry(user_key, seed_turns)
+        with entry.lock:
+            entry.chat.history = list(entry.chat.history) + [
+                {"role": "user", "parts": [message]},
+                {"role": "model", "parts": [reply]},
+            ]
+
+    def reset(self, user_key: str):
+        """Forget the user's chat session (e.g. on 'exit' or log out)."""
+        with self._lock:
+            self._sessions.pop(user_key, None)
+
+    def _discard(self, user_key: str, entry: _Entry):
+        # A failed or half-consumed turn leaves the chat's history unusable
+        # (google-generativeai raises BrokenResponseError on the next read), so
+        # drop it; the next turn rebuilds the session from the stored messages
+        with self._lock:
+            if self._sessions.get(user_key) is entry:
+                del self._sessions[user_key]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_chat_manager() -> ChatSessionManager:
+    """Returns the process-wide chat session manager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ChatSessionManager()
+        return _manager
@@ -0,0 +1,104 @@
+# conversation_store.py
+import os
+import re
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from database import ChatMessage, session_scope
+
+# -----------------------------------------------------------------------------
+# 1. Settings
+# -----------------------------------------------------------------------------
+
+# Messages kept in st.session_state; older ones stay in SQLite only
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "40"))
+# Messages rendered per page on the Chat page
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20"))
+SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "1500"))
+SUMMARY_PREFIX = "Summary of our earlier conversation (for context):"
+SUMMARY_ACK = "Thanks, I have the context of our earlier conversation."
+
+# -----------------------------------------------------------------------------
+# 2. Persistent per-user message log
+# -----------------------------------------------------------------------------
+
+def _to_message(row: ChatMessage) -> dict:
+    return {"id": row.id, "type": row.role, "text": row.text}
+
+def add_message(user_id: int, role: str, text: str) -> dict:
+    """Persist one message and return it in the st.session_state.conversation format."""
+    with session_scope() as session:
+        row = ChatMessage(user_id=user_id, role=role, text=text, created_at=time.time())
+        session.add(row)
+        session.flush()
+        return _to_message(row)
+
+def recent_messages(user_id: int, limit: int, before_id: Optional[int] = None) -> List[dict]:
+    """The last 'limit' messages of a user (optionally older than 'before_id'), oldest first."""
+    with session_scope() as session:
+        query = session.query(ChatMessage).filter(ChatMessage.user_id == user_id)
+        if before_id is not None:
+            query = query.filter(ChatMessage.id < before_id)
+        rows = query.order_by(ChatMessage.id.desc()).limit(limit).all()
+    return [_to_message(row) for row in reversed(rows)]
+
+def clear_messages(user_id: int):
+    with session_scope() as session:
+        session.query(ChatMessage).filter(ChatMessage.user_id == user_id).delete()
+
+def trim_window(conversation: list, window: int = CHAT_WINDOW) -> list:
+    """Keep only the last 'window' messages in memory."""
+    if len(conversation) > window:
+        del conversation[:len(conversation) - window]
+    return conversation
+
+# -----------------------------------------------------------------------------
+# 3. Compact context for the model
+# -----------------------------------------------------------------------------
+
+_FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)", re.S)
+
+def summarize_turns(turns: Sequence[Tuple[str, str]], max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """
+    Compress (role, text) turns into a short context block without another
+    model call: the first sentence of every turn, newest kept when over budget.
+    """
+    lines = []
+    for role, text in turns:
+        text = re.sub(r"\s+", " ", text.replace("*", "")).strip()
+        if text == SUMMARY_ACK:
+            continue
+        if text.startswith(SUMMARY_PREFIX):
+            # Earlier summary block: keep its lines as they are
+            lines.extend(text[len(SUMMARY_PREFIX):].strip().split(" | "))
+            continue
+        match = _FIRST_SENTENCE.match(text)
+        sentence = (match.group(1) if match else text)[:200]
+        speaker = "Patient" if role in ("user", "patient") else "Receptionist"
+        lines.append(f"{speaker}: {sentence}")
+
+    summary, total = [], 0
+    for line in reversed(lines):
+        if total + len(line) > max_chars:
+            break
+        summary.append(line)
+        total += len(line) + 3
+    return f"{SUMMARY_PREFIX} " + " | ".join(reversed(summary))
+
+def build_history(turns: Sequence[Tuple[str, str]], max_turns: int) -> List[dict]:
+    """
+    Model history for (role, text) turns: a summary block for everything
+    but the last 'max_turns' exchanges, then those exchanges verbatim.
+    """
+    max_messages = max_turns * 2
+    older, recent = list(turns[:-max_messages]), list(turns[-max_messages:])
+    # Verbatim part starts with a patient message
+    while recent and recent[0][0] != "user":
+        older.append(recent.pop(0))
+    history = []
+    if older:
+        history.append({"role": "user", "parts": [summarize_turns(older)]})
+        history.append({"role": "model", "parts": [SUMMARY_ACK]})
+    for role, text in recent:
+        history.append({"role": "user" if role == "user" else "model", "parts": [text]})
+    return history
@@ -0,0 +1,201 @@
+# database.py
+import os
+import threading
+from contextlib import contextmanager
+
+import time
+import logging
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Text, Float, ForeignKey, LargeBinary, Index
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+import metrics
+
+# -----------------------------------------------------------------------------
+# 1. One engine for the whole process
+# -----------------------------------------------------------------------------
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///database.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    # Explicit pool: connections are reused across calls instead of reopened
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    pool_pre_ping=True,
+)
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside a writer; busy_timeout makes writers
+        # wait for the lock instead of failing with "database is locked".
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+if metrics.METRICS_ENABLED:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe("sqlite.query", time.perf_counter() - conn.info["query_start"].pop())
+
+# expire_on_commit=False so returned rows stay readable after the session closes
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+Base = declarative_base()
+
+# -----------------------------------------------------------------------------
+# 2. Models
+# -----------------------------------------------------------------------------
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True, nullable=False)
+    password_hash = Column(String, nullable=False)
+    face_encoding = Column(LargeBinary, nullable=True)
+
+    appointments = relationship("Appointment", back_populates="user")
+
+class Appointment(Base):
+    __tablename__ = "appointments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    specialist = Column(String, nullable=False)
+    date = Column(String, nullable=False)
+    time_slot = Column(String, nullable=False)
+    # Set once per booking form submission so a retry or double-submit is not booked twice;
+    # stored as "<user_id>:<client key>", so it is unique per user
+    idempotency_key = Column(String, nullable=True, unique=True)
+
+    user = relationship("User", back_populates="appointments")
+
+    __table_args__ = (
+        # One booking per slot; also serves "which slots of specialist X are
+        # taken between these dates"
+        Index("uq_appointments_slot", "specialist", "date", "time_slot", unique=True),
+    )
+
+class Specialist(Base):
+    __tablename__ = "specialists"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+
+class SlotTemplate(Base):
+    __tablename__ = "slot_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # NULL specialist_id means the slot is offered by every specialist
+    specialist_id = Column(Integer, ForeignKey("specialists.id"), nullable=True, index=True)
+    time_slot = Column(String, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    role = Column(String, nullable=False)  # "user" or "ai"
+    text = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Serves "last N messages of user X, before message id Y"
+        Index("ix_chat_messages_user", "user_id", "id"),
+    )
+
+class CachedResponse(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of system prompt + normalized message
+    reply = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    last_used = Column(Float, nullable=False, index=True)
+    hits = Column(Integer, nullable=False, default=0)
+
+# -----------------------------------------------------------------------------
+# 3. Schema and session helpers
+# -----------------------------------------------------------------------------
+
+DEFAULT_SPECIALISTS = ["Cardiologist", "Neurologist", "Dermatologist", "Orthopedist", "Pediatrician"]
+DEFAULT_TIME_SLOTS = ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "04:00 PM"]
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_db():
+    """Create tables and indexes if they don't exist and seed defaults. Runs once per process."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        Base.metadata.create_all(engine)
+        _migrate()
+        _seed_defaults()
+        _initialized = True
+
+def _migrate():
+    # create_all skips columns and indexes added to tables that already exist
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}')
+                    if column.unique:
+                        conn.exec_driver_sql(
+                            f'CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.name}_{column.name} ON {table.name} ("{column.name}")'
+                        )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except IntegrityError:
+                # Legacy rows violate a unique index; reserve_appointment's
+                # in-transaction check still prevents new double bookings
+                logging.getLogger(__name__).warning(
+                    "Could not create unique index %s: existing duplicate rows. "
+                    "Bookings rely on the in-transaction slot check.", index.name
+                )
+
+def _seed_defaults():
+    session = SessionLocal()
+    try:
+        if session.query(Specialist).count() == 0:
+            session.add_all([Specialist(name=name) for name in DEFAULT_SPECIALISTS])
+        if session.query(SlotTemplate).count() == 0:
+            session.add_all([SlotTemplate(time_slot=slot, position=i) for i, slot in enumerate(DEFAULT_TIME_SLOTS)])
+        session.commit()
+    finally:
+        session.close()
+
+@contextmanager
+def session_scope():
+    """
+    Provide a session for a unit of work: commits on success, rolls back on
+    error and always returns the connection to the pool.
+    """
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
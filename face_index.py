@@ -0,0 +1,151 @@
+# face_index.py
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from face_store import ENCODING_SIZE, Snapshot, distances, unpack
+
+
+class FaceIndex:
+    """
+    In-memory 1:N face index. All stored encodings live in one contiguous
+    (capacity, 128) matrix so a probe is matched against every user with a
+    single vectorized distance computation instead of one DB row at a time.
+
+    The bulk of the faces can come from a read-only memory-mapped snapshot
+    (see face_store.py); faces enrolled or changed after it live in the
+    in-memory matrix, and snapshot rows they replace are masked out.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._matrix = np.empty((initial_capacity, ENCODING_SIZE), dtype=np.float32)
+        self._user_ids = np.empty(initial_capacity, dtype=np.int64)
+        self._emails = []
+        self._positions = {}  # user_id -> row in the matrix
+        self._size = 0
+        self._snapshot = None
+        self._snapshot_removed = None  # bool mask over snapshot rows
+        self.loaded = False
+        # Highest user id read from the DB (or snapshot); later enrollments
+        # by other processes are picked up with load_more()
+        self.loaded_through = 0
+
+    def __len__(self) -> int:
+        base = 0
+        if self._snapshot is not None:
+            base = len(self._snapshot) - int(self._snapshot_removed.sum())
+        return base + self._size
+
+    def load(self, rows: Iterable[Tuple[int, str, bytes]], snapshot: Snapshot = None):
+        """
+        Replace the index contents with (user_id, email, encoding_bytes) rows,
+        e.g. every User that has a face_encoding. With a snapshot, 'rows'
+        only needs the users enrolled after it was written.
+        """
+        with self._lock:
+            self._size = 0
+            self._emails = []
+            self._positions = {}
+            self._snapshot = snapshot
+            self._snapshot_removed = np.zeros(len(snapshot), dtype=bool) if snapshot is not None else None
+            self.loaded_through = snapshot.max_user_id if snapshot is not None else 0
+            self.load_more(rows)
+            self.loaded = True
+
+    def load_more(self, rows: Iterable[Tuple[int, str, bytes]]) -> int:
+        """Add (user_id, email, encoding_bytes) rows read from the DB. Returns how many had a face."""
+        added = 0
+        with self._lock:
+            for user_id, email, encoding_bytes in rows:
+                self.loaded_through = max(self.loaded_through, user_id)
+                if encoding_bytes:
+                    self.add(user_id, email, unpack(encoding_bytes))
+                    added += 1
+        return added
+
+    def _snapshot_row(self, user_id: int) -> Optional[int]:
+        # Snapshot rows are sorted by user_id
+        if self._snapshot is None or not len(self._snapshot):
+            return None
+        row = int(np.searchsorted(self._snapshot.user_ids, user_id))
+        if row < len(self._snapshot) and self._snapshot.user_ids[row] == user_id and not self._snapshot_removed[row]:
+            return row
+        return None
+
+    def add(self, user_id: int, email: str, encoding: np.ndarray):
+        """Insert or replace the encoding for one user, in place."""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            snapshot_row = self._snapshot_row(user_id)
+            if snapshot_row is not None:
+                self._snapshot_removed[snapshot_row] = True
+            row = self._positions.get(user_id)
+            if row is None:
+                self._append(user_id, email, encoding)
+            else:
+                self._matrix[row] = encoding
+                self._emails[row] = email
+
+    def remove(self, user_id: int):
+        """Drop a user from the index by moving the last row into its slot."""
+        with self._lock:
+            snapshot_row = self._snapshot_row(user_id)
+            if snapshot_row is not None:
+                self._snapshot_removed[snapshot_row] = True
+            row = self._positions.pop(user_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._user_ids[row] = self._user_ids[last]
+                self._emails[row] = self._emails[last]
+                self._positions[int(self._user_ids[row])] = row
+            self._emails.pop()
+            self._size = last
+
+    def nearest(self, face_encoding: np.ndarray) -> Optional[Tuple[int, str, float]]:
+        """
+        Return (user_id, email, distance) of the closest stored face,
+        or None if the index is empty.
+        """
+        probe = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        best = None
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and len(snapshot):
+                # Same euclidean distance face_recognition.face_distance uses
+                snapshot_distances = distances(snapshot.matrix, probe, snapshot.scales)
+                snapshot_distances[self._snapshot_removed] = np.inf
+                row = int(np.argmin(snapshot_distances))
+                if np.isfinite(snapshot_distances[row]):
+                    best = (int(snapshot.user_ids[row]), snapshot.emails[row], float(snapshot_distances[row]))
+            if self._size:
+                overlay_distances = distances(self._matrix[:self._size], probe)
+                row = int(np.argmin(overlay_distances))
+                if best is None or overlay_distances[row] < best[2]:
+                    best = (int(self._user_ids[row]), self._emails[row], float(overlay_distances[row]))
+        return best
+
+    def match(self, face_encoding: np.ndarray, tolerance: float = 0.6) -> Optional[Tuple[int, str, float]]:
+        """Like nearest(), but only returns a result within 'tolerance'."""
+        result = self.nearest(face_encoding)
+        if result is None or result[2] > tolerance:
+            return None
+        return result
+
+    def _append(self, user_id: int, email: str, encoding: np.ndarray):
+        if self._size == self._matrix.shape[0]:
+            new_capacity = max(1, self._matrix.shape[0]) * 2
+            matrix = np.empty((new_capacity, ENCODING_SIZE), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            user_ids = np.empty(new_capacity, dtype=np.int64)
+            user_ids[:self._size] = self._user_ids[:self._size]
+            self._matrix, self._user_ids = matrix, user_ids
+        self._matrix[self._size] = encoding
+        self._user_ids[self._size] = user_id
+        self._emails.append(email)
+        self._positions[user_id] = self._size
+        self._size += 1
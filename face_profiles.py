@@ -0,0 +1,69 @@
+# face_profiles.py
+"""
+Named face-encoding profiles trading accuracy for latency, picked per
+deployment with FACE_PROFILE (default "balanced"). Measure them on your own
+hardware and photos with benchmarks/bench_face_profiles.py.
+"""
+import os
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+
+class FaceProfile(NamedTuple):
+    name: str
+    # Face detection runs on the image scaled by this factor; boxes are
+    # mapped back and the encoding uses the full-resolution frame
+    detect_scale: float
+    # "hog" (CPU) or "cnn" (much slower without a GPU, finds harder faces)
+    detector: str
+    # Times to upsample before detecting; finds smaller faces, costs ~4x each
+    upsample: int
+    # Re-samples per encoding, averaged; N jitters cost about N times as much
+    jitters: int
+    # Landmark model used to align the face: "small" (5 points) or "large" (68)
+    landmarks: str
+    # Largest face distance accepted as the same person
+    tolerance: float
+
+
+PROFILES = {
+    "fast": FaceProfile("fast", detect_scale=0.5, detector="hog", upsample=1, jitters=1, landmarks="small", tolerance=0.6),
+    # face_recognition's own defaults, i.e. the behaviour before profiles existed
+    "balanced": FaceProfile("balanced", detect_scale=1.0, detector="hog", upsample=1, jitters=1, landmarks="small", tolerance=0.6),
+    "accurate": FaceProfile("accurate", detect_scale=1.0, detector="cnn", upsample=1, jitters=5, landmarks="large", tolerance=0.55),
+}
+
+FACE_PROFILE = os.getenv("FACE_PROFILE", "balanced")
+
+def get_profile(name: str = None) -> FaceProfile:
+    """The named profile, or the deployment's FACE_PROFILE."""
+    name = name or FACE_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown face profile {name!r}, expected one of {sorted(PROFILES)}")
+
+# -----------------------------------------------------------------------------
+# Detection and encoding with a profile (called inside worker processes)
+# -----------------------------------------------------------------------------
+
+def face_locations(face_recognition, img: np.ndarray, profile: FaceProfile) -> List[Tuple[int, int, int, int]]:
+    """(top, right, bottom, left) boxes in full-resolution coordinates."""
+    scale = profile.detect_scale
+    if scale >= 1.0:
+        return face_recognition.face_locations(img, number_of_times_to_upsample=profile.upsample, model=profile.detector)
+    from PIL import Image
+    height, width = img.shape[:2]
+    small = np.asarray(Image.fromarray(img).resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.BILINEAR))
+    boxes = face_recognition.face_locations(small, number_of_times_to_upsample=profile.upsample, model=profile.detector)
+    return [
+        (max(0, int(top / scale)), min(width, int(right / scale)), min(height, int(bottom / scale)), max(0, int(left / scale)))
+        for top, right, bottom, left in boxes
+    ]
+
+def face_encoding(face_recognition, img: np.ndarray, box, profile: FaceProfile) -> np.ndarray:
+    """128-d encoding of the face in 'box'."""
+    return face_recognition.face_encodings(
+        img, known_face_locations=[box], num_jitters=profile.jitters, model=profile.landmarks
+    )[0]
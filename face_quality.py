@@ -0,0 +1,60 @@
+# face_quality.py
+"""
+Cheap NumPy checks on a camera frame before any dlib work: exposure,
+contrast and sharpness on a small grayscale copy. A bad frame costs well
+under a millisecond here instead of a face detection plus a 128-d encoding.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Longest side of the grayscale copy the checks run on
+QUALITY_MAX_SIDE = int(os.getenv("FACE_QUALITY_MAX_SIDE", "320"))
+MIN_BRIGHTNESS = float(os.getenv("FACE_MIN_BRIGHTNESS", "40"))
+MAX_BRIGHTNESS = float(os.getenv("FACE_MAX_BRIGHTNESS", "220"))
+MIN_CONTRAST = float(os.getenv("FACE_MIN_CONTRAST", "20"))
+# Variance of the Laplacian on the downscaled copy; lower means blurrier
+MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", "30"))
+
+RETAKE_HINTS = {
+    "too_dark": "The photo is too dark. Please face a light source and retake it.",
+    "too_bright": "The photo is overexposed. Please move away from direct light and retake it.",
+    "low_contrast": "The photo is washed out. Please retake it in even lighting.",
+    "blurry": "The photo is blurry. Please hold the camera still and retake it.",
+}
+
+
+def downscaled_gray(img: np.ndarray, max_side: int = QUALITY_MAX_SIDE) -> np.ndarray:
+    """float32 grayscale copy of an RGB (or gray) uint8 image, strided down to about 'max_side'."""
+    step = max(1, -(-max(img.shape[:2]) // max_side))
+    small = img[::step, ::step]
+    if small.ndim == 3:
+        # ITU-R 601 luma, as PIL's convert("L")
+        small = small[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return small.astype(np.float32, copy=False)
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian, a standard focus measure."""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+    return float(lap.var())
+
+def check(img: np.ndarray) -> Optional[str]:
+    """Returns a RETAKE_HINTS key for an unusable frame, or None if it is worth encoding."""
+    gray = downscaled_gray(img)
+    brightness = float(gray.mean())
+    if brightness < MIN_BRIGHTNESS:
+        return "too_dark"
+    if brightness > MAX_BRIGHTNESS:
+        return "too_bright"
+    if float(gray.std()) < MIN_CONTRAST:
+        return "low_contrast"
+    if laplacian_variance(gray) < MIN_SHARPNESS:
+        return "blurry"
+    return None
+
+def largest_face(locations: List[Tuple[int, int, int, int]]) -> Tuple[int, int, int, int]:
+    """The biggest (top, right, bottom, left) box, i.e. the person closest to the camera."""
+    return max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
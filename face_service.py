@@ -0,0 +1,148 @@
+# face_service.py
+import io
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import metrics
+import face_quality
+import face_profiles
+
+# -----------------------------------------------------------------------------
+# 1. Worker side (runs inside the pool processes)
+# -----------------------------------------------------------------------------
+
+_face_recognition = None
+_profile = None
+
+def _init_worker(profile: face_profiles.FaceProfile):
+    # Importing face_recognition loads the dlib detector, landmark and
+    # ResNet models, so do it once per worker instead of once per image.
+    global _face_recognition, _profile
+    import face_recognition
+    _face_recognition = face_recognition
+    _profile = profile
+
+def _warm_up():
+    return os.getpid()
+
+def _encode_image(image_bytes: bytes):
+    # Returns (encodings, stage timings, quality rejection or None); timings
+    # are recorded by the parent process
+    start = time.perf_counter()
+    img = _face_recognition.load_image_file(io.BytesIO(image_bytes))
+    decoded = time.perf_counter()
+    timings = {"face.decode": decoded - start}
+
+    # Cheap gate first: dark, washed out or blurry frames never reach dlib
+    rejected = face_quality.check(img)
+    checked = time.perf_counter()
+    timings["face.quality"] = checked - decoded
+    if rejected:
+        return [], timings, rejected
+
+    locations = face_profiles.face_locations(_face_recognition, img, _profile)
+    located = time.perf_counter()
+    timings["face.locations"] = located - checked
+    if not locations:
+        return [], timings, None
+    # Encode only the largest face, not everyone in the background
+    encodings = [face_profiles.face_encoding(_face_recognition, img, face_quality.largest_face(locations), _profile)]
+    timings["face.encodings"] = time.perf_counter() - located
+    return encodings, timings, None
+
+# -----------------------------------------------------------------------------
+# 2. Service used by the Streamlit script
+# -----------------------------------------------------------------------------
+
+class FaceServiceBusy(Exception):
+    """Raised when the queue is full and no slot frees up in time."""
+
+class FaceServiceTimeout(Exception):
+    """Raised when a worker does not return an encoding in time."""
+
+class FaceQualityError(Exception):
+    """Raised when the frame is too dark, washed out or blurry to encode; the message asks for a retake."""
+
+    def __init__(self, reason: str):
+        super().__init__(face_quality.RETAKE_HINTS[reason])
+        self.reason = reason
+
+
+class FaceService:
+    """
+    Pool of pre-warmed worker processes that turn camera bytes into face
+    encodings, so dlib runs in parallel across cores instead of on the
+    Streamlit script thread.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None,
+                 timeout: float = None, acquire_timeout: float = None, profile: str = None):
+        self.profile = face_profiles.get_profile(profile)
+        self.workers = workers or int(os.getenv("FACE_WORKERS", os.cpu_count() or 1))
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv("FACE_QUEUE_SIZE", self.workers * 2))
+        self.timeout = timeout or float(os.getenv("FACE_TIMEOUT", "15"))
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else float(os.getenv("FACE_ACQUIRE_TIMEOUT", "2"))
+
+        # Backpressure: at most workers + queue_size jobs in flight
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.profile,),
+        )
+        self._warm_up()
+
+    def _warm_up(self):
+        # Start every worker now so the first user does not pay the model load
+        futures = [self._executor.submit(_warm_up) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def encode(self, image_bytes: bytes):
+        """
+        Returns the encoding of the largest face in the image as a one-item
+        list, or [] if no face was found. Raises FaceQualityError for frames
+        that should be retaken, and FaceServiceBusy or FaceServiceTimeout
+        instead of blocking forever.
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            metrics.count("face.rejected")
+            raise FaceServiceBusy("Face service is busy, please try again.")
+        try:
+            future = self._executor.submit(_encode_image, image_bytes)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            with metrics.timer("face.total"):
+                encodings, timings, rejected = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            metrics.count("face.timeouts")
+            raise FaceServiceTimeout("Face encoding timed out, please try again.")
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds)
+        if rejected:
+            metrics.count(f"face.quality_rejected.{rejected}")
+            raise FaceQualityError(rejected)
+        return encodings
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_face_service() -> FaceService:
+    """Returns the process-wide face service, starting the pool on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = FaceService()
+        return _service
@@ -0,0 +1,298 @@
+# face_store.py
+"""
+Compact storage for 128-d face encodings.
+
+Row formats for users.face_encoding, told apart by their length so existing
+rows keep working without a schema change:
+
+    f64  1024 bytes  raw float64, as returned by face_recognition (legacy)
+    f32   512 bytes  float32
+    i8    132 bytes  float32 scale + 128 int8 (per-row symmetric quantization)
+
+A snapshot file holds every enrolled encoding in one versioned, aligned
+binary file that each process can np.memmap at startup instead of reading
+and decoding every row; the OS shares its pages across workers.
+
+    python face_store.py verify --format i8
+    python face_store.py convert --format f32
+    python face_store.py snapshot --format i8 --out face_index.snap
+"""
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+import face_profiles
+
+ENCODING_SIZE = 128
+FORMATS = ("f64", "f32", "i8")
+# Format for newly stored rows; reading always accepts all three
+FACE_ENCODING_FORMAT = os.getenv("FACE_ENCODING_FORMAT", "f64")
+# Optional snapshot loaded by the face index instead of the full users table
+FACE_SNAPSHOT = os.getenv("FACE_SNAPSHOT")
+
+_I8_BYTES = 4 + ENCODING_SIZE
+_FORMAT_BY_LENGTH = {8 * ENCODING_SIZE: "f64", 4 * ENCODING_SIZE: "f32", _I8_BYTES: "i8"}
+
+# Rows per block when scanning a matrix, bounding the temporary float copies
+SCAN_BLOCK = 8192
+
+# -----------------------------------------------------------------------------
+# 1. Row encoding
+# -----------------------------------------------------------------------------
+
+def quantize(matrix: np.ndarray):
+    """(n, 128) floats -> (int8 codes, float32 per-row scales)."""
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def pack(encoding: np.ndarray, fmt: str = None) -> bytes:
+    """Serialize one encoding in 'fmt' (default FACE_ENCODING_FORMAT)."""
+    fmt = fmt or FACE_ENCODING_FORMAT
+    encoding = np.asarray(encoding).reshape(ENCODING_SIZE)
+    if fmt == "f64":
+        return encoding.astype(np.float64).tobytes()
+    if fmt == "f32":
+        return encoding.astype(np.float32).tobytes()
+    if fmt == "i8":
+        codes, scales = quantize(encoding)
+        return scales.tobytes() + codes.tobytes()
+    raise ValueError(f"Unknown face encoding format {fmt!r}, expected one of {FORMATS}")
+
+def format_of(blob: bytes) -> str:
+    try:
+        return _FORMAT_BY_LENGTH[len(blob)]
+    except KeyError:
+        raise ValueError(f"Not a face encoding: {len(blob)} bytes")
+
+def unpack(blob: bytes) -> np.ndarray:
+    """Stored bytes in any format -> float64 vector, as face_recognition expects."""
+    fmt = format_of(blob)
+    if fmt == "f64":
+        return np.frombuffer(blob, dtype=np.float64)
+    if fmt == "f32":
+        return np.frombuffer(blob, dtype=np.float32).astype(np.float64)
+    scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+    return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float64) * scale
+
+def distances(matrix: np.ndarray, probe: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    """
+    Euclidean distance (as face_recognition.face_distance) from 'probe' to
+    every row of 'matrix', which may be a read-only memmap of float32 or
+    int8 codes with per-row 'scales'. Works block by block.
+    """
+    probe = np.asarray(probe, dtype=np.float32).reshape(ENCODING_SIZE)
+    out = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SCAN_BLOCK):
+        block = matrix[start:start + SCAN_BLOCK].astype(np.float32)
+        if scales is not None:
+            block *= scales[start:start + SCAN_BLOCK, None]
+        block -= probe
+        out[start:start + SCAN_BLOCK] = np.sqrt(np.einsum("ij,ij->i", block, block))
+    return out
+
+# -----------------------------------------------------------------------------
+# 2. Snapshot file
+# -----------------------------------------------------------------------------
+#
+#   magic "MDFACE" | uint16 version | uint32 header length | JSON header |
+#   padding to 64 bytes | user_ids int64[n] | scales float32[n] (i8 only) |
+#   matrix float32 or int8 [n, 128]
+#
+# The JSON header has format, count, dim, max_user_id, emails and the byte
+# offset of each array. Rows are sorted by user_id.
+
+SNAPSHOT_MAGIC = b"MDFACE"
+SNAPSHOT_VERSION = 1
+_PREAMBLE = struct.Struct("<6sHI")
+_ALIGN = 64
+
+
+class Snapshot(NamedTuple):
+    format: str
+    max_user_id: int
+    user_ids: np.ndarray
+    emails: List[str]
+    matrix: np.ndarray
+    scales: Optional[np.ndarray]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def write_snapshot(path: str, rows, fmt: str = "f32") -> int:
+    """
+    Write (user_id, email, encoding_bytes) rows to 'path' atomically.
+    Processes that already mapped the old file keep reading it until they
+    reload. Returns the number of encodings written.
+    """
+    if fmt not in ("f32", "i8"):
+        raise ValueError("Snapshots are stored as f32 or i8")
+    rows = sorted((r for r in rows if r[2]), key=lambda r: r[0])
+    user_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    matrix = np.array([unpack(r[2]) for r in rows], dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    scales = None
+    if fmt == "i8":
+        matrix, scales = quantize(matrix)
+
+    arrays = [("user_ids", user_ids)] + ([("scales", scales)] if scales is not None else []) + [("matrix", matrix)]
+    header = {
+        "format": fmt,
+        "count": len(rows),
+        "dim": ENCODING_SIZE,
+        "max_user_id": int(user_ids.max()) if len(rows) else 0,
+        "created_at": time.time(),
+        "emails": [r[1] for r in rows],
+        "arrays": {},
+    }
+    # Offsets depend on the header length, which depends on the offsets' digits;
+    # reserve generous space for them first.
+    header_bytes = json.dumps(header).encode("utf-8") + b" " * 256
+    offset = _align(_PREAMBLE.size + len(header_bytes))
+    for name, array in arrays:
+        header["arrays"][name] = {"offset": offset, "dtype": array.dtype.str}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays:
+            f.seek(header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+    return len(rows)
+
+def open_snapshot(path: str) -> Snapshot:
+    """Map a snapshot read-only. Raises ValueError for unknown files or versions."""
+    with open(path, "rb") as f:
+        magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a face snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} has snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        header = json.loads(f.read(header_length))
+    count, dim = header["count"], header["dim"]
+
+    def mapped(name, shape):
+        spec = header["arrays"].get(name)
+        if spec is None or count == 0:
+            return None if spec is None else np.empty(shape, dtype=spec["dtype"])
+        return np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+
+    return Snapshot(
+        format=header["format"],
+        max_user_id=header["max_user_id"],
+        user_ids=mapped("user_ids", (count,)),
+        emails=header["emails"],
+        matrix=mapped("matrix", (count, dim)),
+        scales=mapped("scales", (count,)),
+    )
+
+# -----------------------------------------------------------------------------
+# 3. Migration and verification
+# -----------------------------------------------------------------------------
+
+def _load_rows():
+    from database import User, session_scope
+    with session_scope() as session:
+        return session.query(User.id, User.email, User.face_encoding).filter(User.face_encoding.isnot(None)).all()
+
+def verify(rows, fmt: str, tolerance: float = 0.6, probes: int = 500, seed: int = 0) -> dict:
+    """
+    Compare match decisions on the stored encodings with the same encodings
+    after a round trip through 'fmt'. Probes are stored faces plus noise
+    sized to land around the tolerance, i.e. the hardest cases.
+    """
+    original = np.array([unpack(r[2]) for r in rows], dtype=np.float64).reshape(-1, ENCODING_SIZE)
+    converted = np.array([unpack(pack(e, fmt)) for e in original], dtype=np.float64).reshape(-1, ENCODING_SIZE)
+    rng = np.random.default_rng(seed)
+    result = {"encodings": len(rows), "probes": 0, "pair_flips": 0, "identity_flips": 0, "max_distance_error": 0.0}
+    if not len(rows):
+        return result
+    for i in rng.integers(0, len(rows), size=probes):
+        noise = rng.normal(size=ENCODING_SIZE)
+        probe = original[i] + noise / np.linalg.norm(noise) * rng.uniform(0.3, 0.9) * tolerance * 1.2
+        before = np.linalg.norm(original - probe, axis=1)
+        after = np.linalg.norm(converted - probe, axis=1)
+        result["probes"] += 1
+        result["pair_flips"] += int(np.count_nonzero((before <= tolerance) != (after <= tolerance)))
+        best_before, best_after = int(np.argmin(before)), int(np.argmin(after))
+        accepted_before, accepted_after = before[best_before] <= tolerance, after[best_after] <= tolerance
+        if accepted_before != accepted_after or (accepted_before and best_before != best_after):
+            result["identity_flips"] += 1
+        result["max_distance_error"] = max(result["max_distance_error"], float(np.abs(before - after).max()))
+    return result
+
+def convert(fmt: str, batch_size: int = 1000) -> int:
+    """Rewrite every stored encoding in 'fmt', in batches. Returns rows changed."""
+    from sqlalchemy import update
+    from database import User, session_scope
+    changed, last_id = 0, 0
+    while True:
+        with session_scope() as session:
+            batch = (session.query(User.id, User.face_encoding)
+                     .filter(User.face_encoding.isnot(None), User.id > last_id)
+                     .order_by(User.id).limit(batch_size).all())
+            if not batch:
+                return changed
+            last_id = batch[-1][0]
+            updates = [{"id": user_id, "face_encoding": pack(unpack(blob), fmt)}
+                       for user_id, blob in batch if format_of(blob) != fmt]
+            if updates:
+                session.execute(update(User), updates)
+            changed += len(updates)
+
+def main():
+    parser = argparse.ArgumentParser(description="Face encoding storage: verify, convert rows, write snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify_cmd = sub.add_parser("verify", help="check match decisions survive a format")
+    verify_cmd.add_argument("--format", choices=FORMATS, default="i8")
+    verify_cmd.add_argument("--probes", type=int, default=500)
+    convert_cmd = sub.add_parser("convert", help="rewrite stored rows in a format (verifies first)")
+    convert_cmd.add_argument("--format", choices=FORMATS, required=True)
+    convert_cmd.add_argument("--force", action="store_true", help="convert even if verification fails")
+    for cmd in (verify_cmd, convert_cmd):
+        cmd.add_argument("--tolerance", type=float, default=face_profiles.get_profile().tolerance)
+        cmd.add_argument("--max-error", type=float, default=0.02,
+                         help="largest acceptable change in any distance; only pairs this close to the tolerance can flip")
+        cmd.add_argument("--max-flips", type=int, default=0,
+                         help="largest acceptable number of probes whose 1:N match changes")
+    snapshot_cmd = sub.add_parser("snapshot", help="write a memory-mappable snapshot of all encodings")
+    snapshot_cmd.add_argument("--format", choices=("f32", "i8"), default="f32")
+    snapshot_cmd.add_argument("--out", default=FACE_SNAPSHOT or "face_index.snap")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        count = write_snapshot(args.out, _load_rows(), args.format)
+        print(f"Wrote {count} encodings to {args.out} ({os.path.getsize(args.out)} bytes)")
+        return
+
+    rows = _load_rows()
+    report = verify(rows, args.format, tolerance=args.tolerance, probes=getattr(args, "probes", 500))
+    print(json.dumps(report, indent=2))
+    ok = report["max_distance_error"] <= args.max_error and report["identity_flips"] <= args.max_flips
+    print(f"{'OK' if ok else 'FAILED'}: max distance error {report['max_distance_error']:.4f} "
+          f"(limit {args.max_error}), {report['identity_flips']} identity flips (limit {args.max_flips}) "
+          f"at tolerance {args.tolerance}")
+    if args.command == "verify":
+        sys.exit(0 if ok else 1)
+    if not ok and not args.force:
+        sys.exit("Not converting; rerun with --force to convert anyway.")
+    print(f"Converted {convert(args.format)} rows to {args.format}")
+
+
+if __name__ == "__main__":
+    main()
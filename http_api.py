@@ -0,0 +1,300 @@
+# http_api.py
+"""
+JSON API for kiosks and integration partners, next to the Streamlit UI.
+
+Runs the same functions as app.py (auth.py, book_appointment.py, the shared
+chat session manager and TTS cache) on one pooled database engine, without
+Streamlit's full-script rerun per interaction.
+
+    python http_api.py --port 8080
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import secrets
+import argparse
+import threading
+import contextvars
+from functools import partial
+
+from aiohttp import web
+
+import metrics
+import conversation_store
+import response_cache
+from database import init_db
+from auth import signup_user, login_user, login_user_with_face, identify_user_by_face, get_user_profile
+from auth_pool import TooManyAttempts, AuthBusy, client_ip
+from book_appointment import reserve_appointment, get_user_appointments, InvalidBooking
+from availability import free_slots, get_specialists
+from face_service import get_face_service, FaceServiceBusy, FaceServiceTimeout, FaceQualityError
+from chat_sessions import get_chat_manager
+
+API_TOKEN_TTL = float(os.getenv("API_TOKEN_TTL", str(12 * 3600)))
+
+# -----------------------------------------------------------------------------
+# 1. Bearer tokens for logged-in clients
+# -----------------------------------------------------------------------------
+
+_tokens = {}  # token -> (UserProfile, expires_at)
+_tokens_lock = threading.Lock()
+
+def _issue_token(profile) -> str:
+    token = secrets.token_urlsafe(32)
+    now = time.time()
+    with _tokens_lock:
+        # Every token gets the same TTL, so insertion order is expiry order
+        while _tokens:
+            oldest = next(iter(_tokens))
+            if _tokens[oldest][1] > now:
+                break
+            del _tokens[oldest]
+        _tokens[token] = (profile, now + API_TOKEN_TTL)
+    return token
+
+def _current_user(request: web.Request):
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else None
+    with _tokens_lock:
+        entry = _tokens.get(token)
+        if entry is None or entry[1] < time.time():
+            _tokens.pop(token, None)
+            raise _error(401, "Missing or expired token. Log in first.")
+        return entry[0]
+
+# -----------------------------------------------------------------------------
+# 2. Helpers
+# -----------------------------------------------------------------------------
+
+_ERRORS = {
+    400: web.HTTPBadRequest,
+    401: web.HTTPUnauthorized,
+    409: web.HTTPConflict,
+    422: web.HTTPUnprocessableEntity,
+    429: web.HTTPTooManyRequests,
+    503: web.HTTPServiceUnavailable,
+}
+
+def _error(status: int, message: str) -> web.HTTPException:
+    """A JSON {"error": ...} response to raise from a handler."""
+    return _ERRORS[status](text=json.dumps({"error": message}), content_type="application/json")
+
+async def _json_body(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise _error(400, "Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise _error(400, "Request body must be a JSON object.")
+    return body
+
+def _text(body: dict, name: str):
+    """The string field 'name' of the body, or None if absent; 400 for any other JSON type."""
+    value = body.get(name)
+    if value is not None and not isinstance(value, str):
+        raise _error(400, f"{name} must be a string.")
+    return value
+
+async def _blocking(fn, *args, **kwargs):
+    # DB, bcrypt and model calls are blocking; keep them off the event loop.
+    # Executor threads don't inherit contextvars, so run in a copy of ours to
+    # keep stage timings attached to the handler's metrics.request
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, partial(context.run, fn, *args, **kwargs))
+
+def _encode_image(image_bytes: bytes):
+    # The first call starts and warms the face worker pool, so it must not run on the loop
+    return get_face_service().encode(image_bytes)
+
+async def _encode_face(body: dict):
+    """Face encodings for the base64 'face_image' in the body, or None if absent."""
+    image = _text(body, "face_image")
+    if not image:
+        return None
+    try:
+        image_bytes = base64.b64decode(image)
+    except ValueError:
+        raise _error(400, "face_image must be base64-encoded.")
+    try:
+        return await _blocking(_encode_image, image_bytes)
+    except FaceQualityError as e:
+        raise _error(422, str(e))
+    except (FaceServiceBusy, FaceServiceTimeout) as e:
+        raise _error(503, str(e))
+
+def _appointment_json(appt) -> dict:
+    return {"id": appt.id, "specialist": appt.specialist, "date": appt.date, "time_slot": appt.time_slot}
+
+# -----------------------------------------------------------------------------
+# 3. Endpoints
+# -----------------------------------------------------------------------------
+
+async def signup(request: web.Request):
+    with metrics.request("api.signup"):
+        body = await _json_body(request)
+        email, password = _text(body, "email"), _text(body, "password")
+        if not email or not password:
+            raise _error(400, "email and password are required.")
+        encodings = await _encode_face(body)
+        face_encoding_bytes = encodings[0].tobytes() if encodings else None
+        try:
+            created = await _blocking(signup_user, email, password, face_encoding_bytes)
+        except AuthBusy as e:
+            raise _error(503, str(e))
+        if not created:
+            raise _error(409, "User with that email already exists.")
+        return web.json_response({"email": email, "face_enrolled": face_encoding_bytes is not None}, status=201)
+
+async def login(request: web.Request):
+    with metrics.request("api.login"):
+        body = await _json_body(request)
+        email, password = _text(body, "email"), _text(body, "password")
+        try:
+            ip = client_ip(request.headers.get("X-Forwarded-For"), request.remote)
+            ok = await _blocking(login_user, email or "", password or "", client_ip=ip)
+        except TooManyAttempts as e:
+            raise _error(429, str(e))
+        except AuthBusy as e:
+            raise _error(503, str(e))
+        if not ok:
+            raise _error(401, "Invalid email or password.")
+        profile = get_user_profile(email)  # Cached by login_user
+        return web.json_response({"token": _issue_token(profile), "user_id": profile.id, "email": profile.email})
+
+async def login_face(request: web.Request):
+    with metrics.request("api.login_face"):
+        body = await _json_body(request)
+        encodings = await _encode_face(body)
+        if not encodings:
+            raise _error(400, "No face detected in face_image.")
+        email = _text(body, "email")
+        if email:
+            matched_email = email if await _blocking(login_user_with_face, email, encodings[0]) else None
+        else:
+            match = await _blocking(identify_user_by_face, encodings[0])
+            matched_email = match[0] if match else None
+        if not matched_email:
+            raise _error(401, "Face login failed: no match.")
+        profile = await _blocking(get_user_profile, matched_email)
+        return web.json_response({"token": _issue_token(profile), "user_id": profile.id, "email": profile.email})
+
+async def list_appointments(request: web.Request):
+    with metrics.request("api.appointments"):
+        profile = _current_user(request)
+        appointments = await _blocking(get_user_appointments, profile.id)
+        return web.json_response({"appointments": [_appointment_json(a) for a in appointments]})
+
+async def availability(request: web.Request):
+    with metrics.request("api.availability"):
+        specialist = request.query.get("specialist")
+        if not specialist:
+            raise _error(400, "specialist is required.")
+        # Checked first: the slot grid cache would otherwise keep every name ever asked for
+        if specialist not in await _blocking(get_specialists):
+            raise _error(400, f"Unknown specialist {specialist!r}.")
+        try:
+            days = min(max(int(request.query.get("days", "14")), 1), 60)
+        except ValueError:
+            raise _error(400, "days must be an integer.")
+        slots = await _blocking(free_slots, specialist, None, days)
+        return web.json_response({"specialist": specialist, "free_slots": slots})
+
+async def book(request: web.Request):
+    with metrics.request("api.book"):
+        profile = _current_user(request)
+        body = await _json_body(request)
+        specialist, date, time_slot = _text(body, "specialist"), _text(body, "date"), _text(body, "time_slot")
+        if not specialist or not date or not time_slot:
+            raise _error(400, "specialist, date and time_slot are required.")
+        # Clients may send their own key (e.g. per kiosk form) to make retries safe
+        idempotency_key = request.headers.get("Idempotency-Key") or _text(body, "idempotency_key")
+        try:
+            result = await _blocking(reserve_appointment, profile.id, specialist, date, time_slot, idempotency_key)
+        except InvalidBooking as e:
+            raise _error(400, str(e))
+        if result.status == "taken":
+            return web.json_response(
+                {"error": "Slot taken.", "alternatives": [{"date": d, "time_slot": t} for d, t in result.alternatives]},
+                status=409,
+            )
+        return web.json_response(
+            {"status": result.status, "appointment": _appointment_json(result.appointment)},
+            status=201 if result.status == "booked" else 200,
+        )
+
+def _chat_turn(profile, message: str) -> str:
+    """Same flow as the Chat page's Send button, without rendering."""
+    first_turn = not conversation_store.recent_messages(profile.id, 1)
+    cached_reply = response_cache.get(message) if first_turn else None
+    user_msg = conversation_store.add_message(profile.id, "user", message)
+
+    def seed_turns():
+        earlier = conversation_store.recent_messages(profile.id, conversation_store.CHAT_WINDOW, before_id=user_msg["id"])
+        return [(m["type"], m["text"]) for m in earlier]
+
+    if cached_reply is not None:
+        reply = cached_reply
+        get_chat_manager().record(profile.email, message, reply, seed_turns)
+    else:
+        reply = get_chat_manager().send(profile.email, message, seed_turns)
+        if first_turn:
+            response_cache.put(message, reply)
+    conversation_store.add_message(profile.id, "ai", reply)
+    return reply
+
+async def chat(request: web.Request):
+    with metrics.request("api.chat"):
+        profile = _current_user(request)
+        body = await _json_body(request)
+        message = (_text(body, "message") or "").strip()
+        if not message:
+            raise _error(400, "message is required.")
+        if message.lower() == "exit":
+            await _blocking(conversation_store.clear_messages, profile.id)
+            get_chat_manager().reset(profile.email)
+            return web.json_response({"reply": None, "cleared": True})
+        reply = await _blocking(_chat_turn, profile, message)
+        response = {"reply": reply}
+        if body.get("with_audio"):
+            import speech
+            try:
+                response["audio_mp3_base64"] = base64.b64encode(await _blocking(speech.synthesize, reply)).decode("ascii")
+            except Exception:
+                response["audio_mp3_base64"] = None  # Text-only if TTS fails
+        return web.json_response(response)
+
+async def prometheus(request: web.Request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+# -----------------------------------------------------------------------------
+# 4. App
+# -----------------------------------------------------------------------------
+
+def create_app() -> web.Application:
+    init_db()
+    metrics.start_file_writer()
+    app = web.Application(client_max_size=8 * 1024 * 1024)  # Room for a camera frame
+    app.add_routes([
+        web.post("/signup", signup),
+        web.post("/login", login),
+        web.post("/login/face", login_face),
+        web.get("/availability", availability),
+        web.get("/appointments", list_appointments),
+        web.post("/appointments", book),
+        web.post("/chat", chat),
+        web.get("/metrics", prometheus),
+    ])
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Receptionist JSON API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", os.getenv("PORT", "8080"))))
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
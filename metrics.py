@@ -0,0 +1,282 @@
+# metrics.py
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------------------------------------------------------
+# 1. Settings
+# -----------------------------------------------------------------------------
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Samples kept per stage for the rolling percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+# Optional sinks: Prometheus text file and/or HTTP endpoint
+METRICS_FILE = os.getenv("METRICS_FILE")
+# Seconds between rewrites of METRICS_FILE
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+logger = logging.getLogger("medidot.metrics")
+if METRICS_ENABLED and not logger.handlers:
+    # The per-request lines are the point of enabling metrics; don't depend on
+    # the host app having configured logging
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# -----------------------------------------------------------------------------
+# 2. Registry
+# -----------------------------------------------------------------------------
+
+class _Stage:
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=METRICS_WINDOW)
+
+
+_stages = {}
+_counters = {}
+_lock = threading.Lock()
+# Stage timings of the request running in this context, for the log line
+_current_request = contextvars.ContextVar("medidot_request", default=None)
+
+def observe(stage: str, seconds: float):
+    """Record one duration for 'stage'."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            entry = _stages[stage] = _Stage()
+        entry.count += 1
+        entry.total += seconds
+        entry.samples.append(seconds)
+    request = _current_request.get()
+    if request is not None:
+        request[stage] = request.get(stage, 0.0) + seconds
+
+def count(name: str, value: int = 1):
+    """Increment a counter."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.perf_counter() - self.start)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            count(f"{self.stage}.errors")
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+def timer(stage: str):
+    """
+    Context manager timing one stage, e.g. `with metrics.timer("gemini.send"):`.
+    Returns a shared no-op object when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+class _Request:
+    __slots__ = ("name", "fields", "start", "token", "stages")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.stages = {}
+        self.token = _current_request.set(self.stages)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        total = time.perf_counter() - self.start
+        _current_request.reset(self.token)
+        observe(f"request.{self.name}", total)
+        record = {
+            "request": self.name,
+            # Streamlit's stop/rerun are BaseExceptions, not failures
+            "ok": exc_type is None or not issubclass(exc_type, Exception),
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+            **self.fields,
+        }
+        for sink in _sinks:
+            try:
+                sink(record)
+            except Exception:
+                logger.exception("Metrics sink %r failed", sink)
+        return False
+
+def _log_sink(record: dict):
+    # One structured log line per request with its per-stage breakdown
+    logger.info(json.dumps(record))
+
+_sinks = [_log_sink]
+
+def add_sink(sink):
+    """Register a callable that receives every finished request record."""
+    _sinks.append(sink)
+
+def request(name: str, **fields):
+    """
+    Context manager around one user action (login, booking, chat send).
+    Stages timed inside it are reported together in a single log line.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Request(name, fields)
+
+# -----------------------------------------------------------------------------
+# 3. Reporting and sinks
+# -----------------------------------------------------------------------------
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summary() -> dict:
+    """{stage: {"count", "p50_ms", "p95_ms", "p99_ms"}} over the rolling window."""
+    with _lock:
+        snapshot = {stage: (entry.count, sorted(entry.samples)) for stage, entry in _stages.items()}
+    result = {}
+    for stage, (total_count, ordered) in sorted(snapshot.items()):
+        if ordered:
+            result[stage] = {
+                "count": total_count,
+                "p50_ms": _percentile(ordered, 50) * 1000,
+                "p95_ms": _percentile(ordered, 95) * 1000,
+                "p99_ms": _percentile(ordered, 99) * 1000,
+            }
+    return result
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+def _metric_name(name: str) -> str:
+    return "medidot_" + "".join(c if c.isalnum() else "_" for c in name)
+
+def render_prometheus() -> str:
+    """All stages and counters in the Prometheus text exposition format."""
+    lines = [
+        "# HELP medidot_stage_seconds Per-stage latency (rolling quantiles).",
+        "# TYPE medidot_stage_seconds summary",
+    ]
+    with _lock:
+        stages = {stage: (entry.count, entry.total, sorted(entry.samples)) for stage, entry in _stages.items()}
+        counter_values = dict(_counters)
+    for stage, (total_count, total, ordered) in sorted(stages.items()):
+        for quantile in (0.5, 0.95, 0.99):
+            value = _percentile(ordered, quantile * 100) if ordered else 0.0
+            lines.append(f'medidot_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+        lines.append(f'medidot_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'medidot_stage_seconds_count{{stage="{stage}"}} {total_count}')
+    for name, value in sorted(counter_values.items()):
+        lines.append(f"# TYPE {_metric_name(name)}_total counter")
+        lines.append(f"{_metric_name(name)}_total {value}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_file(path: str = None):
+    """Write the Prometheus text to METRICS_FILE (e.g. for node_exporter's textfile collector)."""
+    path = path or METRICS_FILE
+    if not METRICS_ENABLED or not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_http_server(port: int = None):
+    """Serve /metrics on METRICS_PORT from a daemon thread (once per process)."""
+    global _server
+    port = port or METRICS_PORT
+    if not METRICS_ENABLED or not port:
+        return
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError:
+                # e.g. the port is held by another app process; serving the app matters more
+                logger.warning("Could not serve metrics on port %s", port, exc_info=True)
+                return
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+
+_file_writer = None
+
+def start_file_writer(path: str = None, interval: float = None):
+    """Rewrite METRICS_FILE every METRICS_FILE_INTERVAL seconds from a daemon thread (once per process)."""
+    global _file_writer
+    path = path or METRICS_FILE
+    interval = interval or METRICS_FILE_INTERVAL
+    if not METRICS_ENABLED or not path:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_prometheus_file(path)
+            except OSError:
+                logger.warning("Could not write metrics file %s", path, exc_info=True)
+
+    with _server_lock:
+        if _file_writer is None:
+            _file_writer = threading.Thread(target=run, name="metrics-file", daemon=True)
+            _file_writer.start()
@@ -0,0 +1,88 @@
+# response_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from database import CachedResponse, session_scope
+from chat_sessions import MODEL_NAME, SYSTEM_HISTORY
+import metrics
+
+# -----------------------------------------------------------------------------
+# 1. Settings
+# -----------------------------------------------------------------------------
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+# Replies depend on the model and the role-play prompt as well as the message
+_PROMPT_FINGERPRINT = hashlib.sha256(json.dumps([MODEL_NAME, SYSTEM_HISTORY], sort_keys=True).encode("utf-8")).hexdigest()
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+# -----------------------------------------------------------------------------
+# 2. First-turn response cache
+# -----------------------------------------------------------------------------
+
+def normalize_message(message: str) -> str:
+    """'I have a Headache!!' and 'i have a headache' share one entry."""
+    message = re.sub(r"[^\w\s]", " ", message.lower())
+    return re.sub(r"\s+", " ", message).strip()
+
+def cache_key(message: str) -> str:
+    return hashlib.sha256(f"{_PROMPT_FINGERPRINT}\0{normalize_message(message)}".encode("utf-8")).hexdigest()
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.count(f"response_cache.{name}")
+
+def get(message: str) -> Optional[str]:
+    """Cached reply for a first-turn 'message', or None on a miss or when disabled."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    now = time.time()
+    with session_scope() as session:
+        entry = session.get(CachedResponse, cache_key(message))
+        if entry is None or entry.created_at < now - RESPONSE_CACHE_TTL:
+            _count("misses")
+            return None
+        entry.last_used = now
+        entry.hits += 1
+        reply = entry.reply
+    _count("hits")
+    return reply
+
+def put(message: str, reply: str):
+    """Store the model's reply to a first-turn 'message' and evict old entries."""
+    if not RESPONSE_CACHE_ENABLED or not reply:
+        return
+    now = time.time()
+    try:
+        with session_scope() as session:
+            session.merge(CachedResponse(key=cache_key(message), reply=reply, created_at=now, last_used=now, hits=0))
+            session.flush()
+    except IntegrityError:
+        # A concurrent first turn stored the same message; its reply is as good
+        return
+    with session_scope() as session:
+        session.query(CachedResponse).filter(CachedResponse.created_at < now - RESPONSE_CACHE_TTL).delete()
+        # LRU: drop the least recently used entries beyond the cap
+        overflow = session.query(CachedResponse).count() - RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale = session.query(CachedResponse.key).order_by(CachedResponse.last_used).limit(overflow).subquery()
+            session.query(CachedResponse).filter(CachedResponse.key.in_(stale.select())).delete(synchronize_session=False)
+
+def stats() -> dict:
+    """Hit/miss counters for this process."""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
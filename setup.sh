@@ -31,8 +31,8 @@ pip install -r requirements.txt
 echo "Setting up SQLite database..."
 if [ ! -f database.db ]; then
     python -c "
-from app import Base, engine;
-Base.metadata.create_all(bind=engine)
+from database import init_db;
+init_db()
 "
 fi
 
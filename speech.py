@@ -0,0 +1,151 @@
+# speech.py
+import io
+import os
+import re
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from audio_cache import get_audio_cache
+import metrics
+
+# -----------------------------------------------------------------------------
+# 1. Sentence chunking of a streamed reply
+# -----------------------------------------------------------------------------
+
+# A sentence ends at . ! ? (optionally followed by quotes/brackets) and
+# whitespace, or at a line break (list items, headings).
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+MIN_SENTENCE_CHARS = 20
+
+def pop_sentences(buffer: str, min_chars: int = MIN_SENTENCE_CHARS) -> Tuple[List[str], str]:
+    """
+    Split the complete sentences off the front of 'buffer'.
+    Returns (sentences, remainder). Very short fragments are merged with the
+    next one so TTS is not called for every "1." or "Okay.".
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(buffer):
+        sentence = buffer[start:match.end()]
+        if len(sentence.strip()) >= min_chars:
+            sentences.append(sentence.strip())
+            start = match.end()
+    return sentences, buffer[start:]
+
+def clean_for_speech(text: str) -> str:
+    """Strip markdown emphasis so it is not read out loud."""
+    return text.replace("*", "").replace("#", "").strip()
+
+# -----------------------------------------------------------------------------
+# 2. Text to speech
+# -----------------------------------------------------------------------------
+
+# Phrases every session hears; synthesized once and then served from the cache
+GREETING = "Hello! I'm your AI Receptionist. Please tell me what symptoms you are experiencing."
+STOCK_PHRASES = [GREETING]
+# Seconds before a gTTS request is abandoned (the message stays text-only)
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "10"))
+
+def _gtts_bytes(text: str, lang: str) -> bytes:
+    from gtts import gTTS
+    buffer = io.BytesIO()
+    with metrics.timer("tts.gtts"):
+        gTTS(text, lang=lang, timeout=TTS_TIMEOUT).write_to_fp(buffer)
+    return buffer.getvalue()
+
+def synthesize(text: str, lang: str = "en") -> bytes:
+    """Return the MP3 bytes for 'text', calling gTTS only on a cache miss."""
+    with metrics.timer("tts.synthesize"):
+        return get_audio_cache().get_or_create(clean_for_speech(text), _gtts_bytes, lang)
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_WORKERS", "4")), thread_name_prefix="tts")
+
+def cached_audio(text: str, lang: str = "en") -> Optional[bytes]:
+    """Return the audio for 'text' only if it is already cached; never calls gTTS."""
+    return get_audio_cache().get(clean_for_speech(text), lang)
+
+def synthesize_async(text: str, lang: str = "en") -> Future:
+    """Start synthesis in the background; the future resolves to MP3 bytes."""
+    return _executor.submit(synthesize, text, lang)
+
+def join_audio(futures: List[Future]) -> Future:
+    """
+    A future resolving to the MP3 bytes of 'futures' concatenated in order,
+    once all of them are done. Failed parts are left out.
+    """
+    joined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def part_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        joined.set_result(b"".join(f.result() for f in futures if f.exception() is None))
+
+    if not futures:
+        joined.set_result(b"")
+    for future in futures:
+        future.add_done_callback(part_done)
+    return joined
+
+def attach_audio(message: dict, lang: str = "en", future: Future = None) -> dict:
+    """
+    Mark a conversation message as "audio pending" and start its synthesis
+    (or adopt 'future', already running). The text can be shown right away;
+    resolve_audio() attaches the MP3 later.
+    """
+    message["audio_pending"] = True
+    message["audio_started"] = time.monotonic()
+    message["audio_future"] = future or synthesize_async(message["text"], lang)
+    return message
+
+def resolve_audio(message: dict) -> bool:
+    """
+    Move finished audio from the pending future onto the message.
+    A failed synthesis leaves the message text-only. Returns True while
+    the audio is still pending.
+    """
+    future = message.get("audio_future")
+    if future is None:
+        return False
+    if not future.done():
+        return True
+    try:
+        message["audio"] = future.result()
+    except Exception:
+        message["audio_error"] = True
+    message.pop("audio_future", None)
+    message["audio_pending"] = False
+    return False
+
+_warmed = set()
+
+def warm_stock_phrases(lang: str = "en"):
+    """Synthesize the stock phrases in the background once per process, before first use."""
+    if lang in _warmed:
+        return
+    _warmed.add(lang)
+    for phrase in STOCK_PHRASES:
+        _executor.submit(synthesize, phrase, lang)
+
+def stream_speech(chunks: Iterable[str], lang: str = "en") -> Iterator[Tuple[str, str, Optional[Future]]]:
+    """
+    Pipeline a streamed reply into speech. Yields ("text", chunk, None) for
+    every incoming chunk and ("sentence", sentence, future) as soon as a
+    sentence is complete, with its synthesis already running in the
+    background while later sentences are still being generated. The future
+    resolves to that sentence's MP3 bytes.
+    """
+    buffer = ""
+    for chunk in chunks:
+        yield "text", chunk, None
+        sentences, buffer = pop_sentences(buffer + chunk)
+        for sentence in sentences:
+            if clean_for_speech(sentence):
+                yield "sentence", sentence, _executor.submit(synthesize, sentence, lang)
+    if clean_for_speech(buffer):
+        yield "sentence", buffer.strip(), _executor.submit(synthesize, buffer.strip(), lang)
@@ -0,0 +1,45 @@
+# user_cache.py
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class UserProfile(NamedTuple):
+    id: int
+    email: str
+    has_face: bool
+
+
+class UserCache:
+    """
+    Process-wide LRU of user profiles keyed by email, so booking and chat
+    resolve the user ID without a DB query. Profile fields never change once
+    a user exists, so entries are only replaced on login and signup.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str) -> Optional[UserProfile]:
+        with self._lock:
+            profile = self._profiles.get(email)
+            if profile is not None:
+                self._profiles.move_to_end(email)
+            return profile
+
+    def put(self, profile: UserProfile):
+        with self._lock:
+            self._profiles[profile.email] = profile
+            self._profiles.move_to_end(profile.email)
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+user_cache = UserCache()